@@ -0,0 +1,57 @@
+"""Удаление аккаунта целиком — несколькими DELETE на стороне БД.
+
+ORM-путь (session.delete(user) с загрузкой детей) на библиотеке в 100k
+треков тянет каждую строку в память и удаляет её отдельным запросом.
+Здесь связи удаляются пачкой по внешнему ключу, от листьев к корню, чтобы
+каскадам ON DELETE CASCADE уже нечего было искать; агрегаты статистики и
+задачи пользователя уходят каскадом вместе со строкой users.
+Файлы обложек удаляются только после успешного коммита.
+"""
+from pathlib import Path
+
+from sqlalchemy import delete, select
+
+import fragments
+from models import Playlist, PlaylistTrack, Track, User
+
+
+def delete_account(session, user_id: int, static_root=None) -> dict:
+    """Удалить пользователя и всё его содержимое одной транзакцией."""
+    covers = session.execute(
+        select(Playlist.cover).where(Playlist.user_id == user_id, Playlist.cover.isnot(None))
+    ).scalars().all()
+    own_playlists = select(Playlist.id).where(Playlist.user_id == user_id).scalar_subquery()
+
+    stats = {}
+    stats["playlist_tracks"] = session.execute(
+        delete(PlaylistTrack).where(PlaylistTrack.playlist_id.in_(own_playlists))
+    ).rowcount
+    stats["playlists"] = session.execute(delete(Playlist).where(Playlist.user_id == user_id)).rowcount
+    track_ids = session.execute(
+        delete(Track).where(Track.user_id == user_id).returning(Track.id)
+    ).scalars().all()
+    stats["tracks"] = len(track_ids)
+    stats["users"] = session.execute(delete(User).where(User.id == user_id)).rowcount
+    session.commit()
+    # объекты этого пользователя в identity map больше не соответствуют БД
+    session.expunge_all()
+    # массовый DELETE не вызывает after_delete — фрагменты треков выкидываем сами
+    for track_id in track_ids:
+        fragments.cache.invalidate(("track", track_id))
+
+    stats["covers"] = remove_covers(covers, static_root) if static_root else 0
+    return stats
+
+
+def remove_covers(rel_paths, static_root) -> int:
+    """Удалить файлы обложек (пути относительно /static); ошибки ФС не критичны."""
+    removed = 0
+    for rel in rel_paths:
+        try:
+            path = Path(static_root) / rel
+            if path.exists():
+                path.unlink(missing_ok=True)
+                removed += 1
+        except Exception:
+            pass
+    return removed
@@ -1,15 +1,16 @@
 import os
-import csv
+from datetime import datetime
 from pathlib import Path
 from random import randint
 
+import click
 from uuid import uuid4
 from pathlib import Path
-from flask_wtf.file import FileField, FileAllowed
+from flask_wtf.file import FileField, FileAllowed, FileRequired
 from wtforms import TextAreaField
 from models import db, User, Track, Catalog, seed_catalog, Playlist, PlaylistTrack
 
-from flask import Flask, render_template, redirect, url_for, request, flash, jsonify
+from flask import Flask, render_template, redirect, url_for, request, flash, jsonify, get_template_attribute, abort
 from flask_login import (
     LoginManager, login_user, current_user, login_required, logout_user
 )
@@ -17,9 +18,25 @@ from flask_wtf import FlaskForm
 from wtforms import StringField, PasswordField, SubmitField
 from wtforms.validators import DataRequired, Email, Length, EqualTo
 from flask_migrate import Migrate
-from sqlalchemy import func, tuple_
+from jinja2 import FileSystemBytecodeCache
+from sqlalchemy import and_, false, func, insert, or_, tuple_
+from sqlalchemy.orm import defer, undefer
 
 from models import db, User, Track, Catalog, seed_catalog
+from ordering import (last_rank, lock_playlist, rank_after, rank_for_move, needs_rebalance,
+                      rebalance_playlist, too_long)
+from models import Job
+from jobs import enqueue as enqueue_job, run_worker
+from catalog_import import import_catalog
+from catalog_sync import sync_catalog
+from snapshot import dump_catalog, read_manifest, restore_catalog
+import stats as libstats
+import fragments
+from accounts import delete_account, remove_covers
+from models import Artist, Album
+from artists import artist_id_for, artists_matching, link_catalog, link_tracks
+from previews import send_preview
+from werkzeug.security import safe_join
 
 
 def create_app():
@@ -35,9 +52,21 @@ def create_app():
 
     app.config["MAX_CONTENT_LENGTH"] = 5 * 1024 * 1024  # 5 MB
     app.config["PLAYLIST_COVERS_REL"] = "uploads/playlists"  # относит. путь внутри /static
+    app.config["IMPORT_DIR"] = os.getenv("IMPORT_DIR", str(Path(app.root_path) / "data" / "imports"))
+    app.config["PREVIEWS_DIR"] = os.getenv("PREVIEWS_DIR", str(Path(app.root_path) / "data" / "previews"))
+    # за nginx: внутренний location с alias на PREVIEWS_DIR, например "/_previews"
+    app.config["PREVIEW_ACCEL_REDIRECT"] = os.getenv("PREVIEW_ACCEL_REDIRECT") or None
+    # кто может загружать CSV в общий каталог (email через запятую)
+    app.config["CATALOG_ADMINS"] = {e.strip().lower() for e in os.getenv("CATALOG_ADMINS", "").split(",") if e.strip()}
     # гарантируем, что папка для обложек существует
     (Path(app.root_path) / "static" / app.config["PLAYLIST_COVERS_REL"]).mkdir(parents=True, exist_ok=True)
 
+    # скомпилированные шаблоны на диске: процессы после рестарта не компилируют их заново
+    jinja_cache_dir = Path(os.getenv("JINJA_CACHE_DIR", str(Path(app.root_path) / "data" / "jinja_cache")))
+    jinja_cache_dir.mkdir(parents=True, exist_ok=True)
+    app.jinja_options = {**app.jinja_options, "bytecode_cache": FileSystemBytecodeCache(str(jinja_cache_dir))}
+    app.add_template_global(fragments.track_fragment)
+
     # --- Инициализация ---
     db.init_app(app)
     Migrate(app, db)
@@ -72,6 +101,14 @@ def create_app():
         cover = FileField("Обложка", validators=[FileAllowed(["png","jpg","jpeg","webp","gif"], "Только изображения!")])
         submit = SubmitField("Создать")
 
+    class AccountDeleteForm(FlaskForm):
+        password = PasswordField("Пароль для подтверждения", validators=[DataRequired(), Length(max=64)])
+        submit = SubmitField("Удалить аккаунт")
+
+    class CatalogImportForm(FlaskForm):
+        file = FileField("CSV каталога", validators=[FileRequired(), FileAllowed(["csv"], "Только CSV!")])
+        submit = SubmitField("Загрузить")
+
     def _save_cover(file_storage):
         if not file_storage or not getattr(file_storage, "filename", ""):
             return None
@@ -86,6 +123,39 @@ def create_app():
         (abs_dir / name).save(file_storage) if hasattr(Path, "save") else file_storage.save(abs_dir / name)
         return str(rel_dir / name).replace("\\", "/")                 # например: uploads/playlists/abc.jpg
 
+    def _catalog_details(tracks, modal: str | None = None):
+        """{track.id: Catalog | None} одним запросом по парам (title, artist).
+        Тексты песен догружаются только для модалок `modal`, которых нет в кэше фрагментов."""
+        if not tracks:
+            return {}
+        fragments.check_generation(db.session)
+        pairs = [(t.title.lower().strip(), t.artist.lower().strip()) for t in tracks]
+        cat_rows = (db.session.query(Catalog)
+                    .options(defer(Catalog.lyrics))
+                    .filter(tuple_(func.lower(Catalog.title), func.lower(Catalog.artist)).in_(pairs))
+                    .all())
+        cat_map = {(c.title.lower().strip(), c.artist.lower().strip()): c for c in cat_rows}
+        details = {t.id: cat_map.get((t.title.lower().strip(), t.artist.lower().strip())) for t in tracks}
+        if modal:
+            need = fragments.uncached(modal, tracks, details)
+            if need:
+                (db.session.query(Catalog)
+                 .options(undefer(Catalog.lyrics))
+                 .filter(Catalog.id.in_(need))
+                 .all())
+        return details
+
+    def _schedule_rebalance(pl_id: int):
+        """Перенумеровать ключи плейлиста задачей `flask worker`, не задерживая ответ.
+        Уже стоящая в очереди перенумерация этого плейлиста не дублируется."""
+        queued = (db.session.query(Job.payload)
+                  .filter(Job.kind == "rebalance-playlist", Job.status == "queued",
+                          Job.user_id == current_user.id)
+                  .all())
+        if any((p or {}).get("playlist_id") == pl_id for (p,) in queued):
+            return
+        enqueue_job(db.session, "rebalance-playlist", {"playlist_id": pl_id}, user_id=current_user.id)
+
 
     # --- Роуты страниц ---
     @app.route("/")
@@ -137,10 +207,30 @@ def create_app():
         flash("Вы вышли из аккаунта", "info")
         return redirect(url_for("index"))
 
+    @app.post("/account/delete")
+    @login_required
+    def account_delete():
+        form = AccountDeleteForm()
+        # CSRF-токен и пароль: удаление необратимо, подделанный POST не должен его запускать
+        if not form.validate_on_submit() or not current_user.check_password(form.password.data):
+            flash("Аккаунт не удалён: неверный пароль или устаревшая форма", "warning")
+            return redirect(url_for("dashboard"))
+        user_id = current_user.id
+        logout_user()
+        delete_account(db.session, user_id, Path(app.root_path) / "static")
+        flash("Аккаунт и все данные удалены", "info")
+        return redirect(url_for("index"))
+
     @app.route("/dashboard")
     @login_required
     def dashboard():
-        return render_template("dashboard.html")
+        return render_template("dashboard.html", stats=libstats.summary(db.session, current_user.id),
+                               delete_form=AccountDeleteForm())
+
+    @app.get("/api/stats")
+    @login_required
+    def api_stats():
+        return jsonify(libstats.summary(db.session, current_user.id))
     
         # --- Плейлисты: список/создание ---
     @app.route("/playlists", methods=["GET", "POST"])
@@ -156,6 +246,8 @@ def create_app():
                 cover=cover_rel
             )
             db.session.add(pl)
+            db.session.flush()
+            libstats.playlist_created(db.session, current_user.id, pl.id)
             db.session.commit()
             flash("Плейлист создан", "success")
             return redirect(url_for("playlists"))
@@ -163,8 +255,8 @@ def create_app():
                .filter_by(user_id=current_user.id)
                .order_by(Playlist.created_at.desc())
                .all())
-        # количество треков для карточек
-        counts = {pl.id: db.session.query(PlaylistTrack).filter_by(playlist_id=pl.id).count() for pl in pls}
+        # количество треков для карточек — из агрегатов, одним запросом
+        counts = libstats.playlist_sizes(db.session, [pl.id for pl in pls])
         return render_template("playlists.html", form=form, playlists=pls, counts=counts)
 
     # --- Детали плейлиста и управление треками ---
@@ -178,57 +270,152 @@ def create_app():
         items = (db.session.query(PlaylistTrack)
                  .filter_by(playlist_id=pl.id)
                  .join(Track, PlaylistTrack.track_id == Track.id)
-                 .order_by(Track.artist.asc(), Track.title.asc())
+                 .order_by(PlaylistTrack.rank.asc(), PlaylistTrack.track_id.asc())
                  .all())
-        in_ids = {it.track_id for it in items}
-        # можно добавить только свои треки, которых нет в плейлисте
-        candidates = (db.session.query(Track)
-                      .filter(Track.user_id == current_user.id)
-                      .filter(~Track.id.in_(in_ids) if in_ids else True)
-                      .order_by(Track.artist.asc(), Track.title.asc())
-                      .all())
-        details_by_track = {}
-        if items:
-            pairs = [(it.track.title.lower().strip(), it.track.artist.lower().strip()) for it in items]
-            cat_rows = (db.session.query(Catalog)
-                        .filter(tuple_(func.lower(Catalog.title), func.lower(Catalog.artist)).in_(pairs))
-                        .all())
-            cat_map = {(c.title.lower().strip(), c.artist.lower().strip()): c for c in cat_rows}
-            for it in items:
-                key = (it.track.title.lower().strip(), it.track.artist.lower().strip())
-                details_by_track[it.track_id] = cat_map.get(key)
+        details_by_track = _catalog_details([it.track for it in items], modal="pl_modal")
 
         return render_template(
             "playlist_detail.html",
-            pl=pl, items=items, candidates=candidates,
+            pl=pl, items=items,
             details_by_track=details_by_track  # передаём в шаблон
         )
 
+    @app.get("/api/playlists/<int:pl_id>/candidates")
+    @login_required
+    def api_playlist_candidates(pl_id: int):
+        """Свои треки, которых нет в плейлисте: поиск + keyset-пагинация.
+        ?q= — префикс (короткий запрос) или подстрока в названии/исполнителе,
+        ?after=<track_id> — продолжить после последнего показанного трека.
+        """
+        pl = (db.session.query(Playlist)
+              .filter_by(id=pl_id, user_id=current_user.id)
+              .first_or_404())
+        q = (request.args.get("q") or "").strip().lower()
+        after = request.args.get("after", type=int)
+        limit = max(1, min(request.args.get("limit", 50, type=int), 200))
+
+        in_playlist = (db.session.query(PlaylistTrack.track_id)
+                       .filter(PlaylistTrack.playlist_id == pl.id,
+                               PlaylistTrack.track_id == Track.id))
+        query = (db.session.query(Track.id, Track.title, Track.artist)
+                 .filter(Track.user_id == current_user.id)
+                 .filter(~in_playlist.exists()))
+        if q:
+            # <3 символов триграммный индекс не помогает — ищем по началу строки
+            op = "startswith" if len(q) < 3 else "contains"
+            query = query.filter(getattr(func.lower(Track.artist), op)(q, autoescape=True)
+                                 | getattr(func.lower(Track.title), op)(q, autoescape=True))
+        if after:
+            last = (db.session.query(Track.artist, Track.title)
+                    .filter_by(id=after, user_id=current_user.id)
+                    .first())
+            if last:
+                query = query.filter(tuple_(Track.artist, Track.title, Track.id)
+                                     > tuple_(last.artist, last.title, after))
+        rows = (query.order_by(Track.artist.asc(), Track.title.asc(), Track.id.asc())
+                .limit(limit + 1)
+                .all())
+        more = len(rows) > limit
+        rows = rows[:limit]
+        return jsonify({
+            "items": [{"id": r.id, "title": r.title, "artist": r.artist} for r in rows],
+            "next": rows[-1].id if more else None,
+        })
+
+    def _addable_tracks(pl, ids):
+        """Свои треки из ids, которых ещё нет в плейлисте, — в порядке ids."""
+        tracks = (db.session.query(Track)
+                  .filter(Track.user_id == current_user.id, Track.id.in_(ids))
+                  .filter(~Track.id.in_(db.session.query(PlaylistTrack.track_id)
+                                        .filter(PlaylistTrack.playlist_id == pl.id)
+                                        .filter(PlaylistTrack.track_id.in_(ids))))
+                  .all())
+        order = {tid: n for n, tid in enumerate(ids)}
+        tracks.sort(key=lambda t: order[t.id])
+        return tracks
+
+    def _append_tracks(pl, tracks) -> None:
+        """Добавить треки в конец плейлиста одной транзакцией под блокировкой плейлиста."""
+        if not tracks:
+            return
+        lock_playlist(db.session, pl.id)
+
+        def ranked():
+            out, key = [], last_rank(db.session, pl.id)
+            for t in tracks:
+                key = rank_after(key)
+                out.append({"playlist_id": pl.id, "track_id": t.id, "rank": key})
+            return out, key
+
+        rows, rank = ranked()
+        if too_long(rank):
+            rebalance_playlist(db.session, pl.id, commit=False)
+            rows, rank = ranked()
+        db.session.execute(insert(PlaylistTrack), rows)
+        libstats.playlist_tracks_changed(db.session, current_user.id, pl.id, len(rows))
+        db.session.commit()
+        if needs_rebalance(rank):
+            _schedule_rebalance(pl.id)
+
+    def _playlist_count(pl_id: int) -> int:
+        # счётчик из агрегатов статистики, а не count(*) по плейлисту
+        return libstats.playlist_sizes(db.session, [pl_id]).get(pl_id, 0)
+
     @app.post("/playlists/<int:pl_id>/add")
     @login_required
     def playlist_add_track(pl_id: int):
+        """Обычная отправка формы (без JS): все выбранные в списке треки."""
         pl = (db.session.query(Playlist)
               .filter_by(id=pl_id, user_id=current_user.id)
               .first_or_404())
-        track_id = request.form.get("track_id", type=int)
-        if not track_id:
+        ids = list(dict.fromkeys(i for i in request.form.getlist("track_id", type=int) if i))
+        if not ids:
             flash("Не выбран трек", "warning")
             return redirect(url_for("playlist_detail", pl_id=pl.id))
-        track = (db.session.query(Track)
-                 .filter_by(id=track_id, user_id=current_user.id)
-                 .first())
-        if not track:
-            flash("Нельзя добавить этот трек", "danger")
-            return redirect(url_for("playlist_detail", pl_id=pl.id))
-        exists = db.session.query(PlaylistTrack).filter_by(playlist_id=pl.id, track_id=track.id).first()
-        if exists:
-            flash("Трек уже в плейлисте", "info")
+        tracks = _addable_tracks(pl, ids)
+        if not tracks:
+            flash("Треки уже в плейлисте или недоступны", "info")
             return redirect(url_for("playlist_detail", pl_id=pl.id))
-        db.session.add(PlaylistTrack(playlist_id=pl.id, track_id=track.id))
-        db.session.commit()
-        flash("Трек добавлен в плейлист", "success")
+        _append_tracks(pl, tracks)
+        if len(tracks) == 1:
+            flash("Трек добавлен в плейлист", "success")
+        else:
+            flash(f"Добавлено треков: {len(tracks)}", "success")
         return redirect(url_for("playlist_detail", pl_id=pl.id))
 
+    @app.post("/api/playlists/<int:pl_id>/move")
+    @login_required
+    def playlist_move_track(pl_id: int):
+        """Переставить трек сразу после after_id (null — в начало).
+        Меняется одна строка PlaylistTrack."""
+        pl = (db.session.query(Playlist)
+              .filter_by(id=pl_id, user_id=current_user.id)
+              .first_or_404())
+        data = request.get_json(silent=True) or {}
+        track_id = data.get("track_id")
+        after_id = data.get("after_id")
+        if not isinstance(track_id, int) or not (after_id is None or isinstance(after_id, int)):
+            return jsonify({"ok": False, "error": "bad request"}), 400
+        if after_id == track_id:
+            return jsonify({"ok": False, "error": "bad request"}), 400
+        pt = db.session.query(PlaylistTrack).filter_by(playlist_id=pl.id, track_id=track_id).first()
+        if not pt:
+            return jsonify({"ok": False, "error": "not found"}), 404
+        lock_playlist(db.session, pl.id)
+        try:
+            rank = rank_for_move(db.session, pl.id, track_id, after_id)
+        except LookupError:
+            return jsonify({"ok": False, "error": "not found"}), 404
+        if too_long(rank):
+            # в один промежуток переносили сотни раз — перенумеровываем сразу, под той же блокировкой
+            rebalance_playlist(db.session, pl.id, commit=False)
+            rank = rank_for_move(db.session, pl.id, track_id, after_id)
+        pt.rank = rank
+        db.session.commit()
+        if needs_rebalance(rank):
+            _schedule_rebalance(pl.id)
+        return jsonify({"ok": True, "rank": rank})
+
     @app.post("/playlists/<int:pl_id>/remove/<int:track_id>")
     @login_required
     def playlist_remove_track(pl_id: int, track_id: int):
@@ -238,26 +425,73 @@ def create_app():
         pt = db.session.query(PlaylistTrack).filter_by(playlist_id=pl.id, track_id=track_id).first()
         if pt:
             db.session.delete(pt)
+            libstats.playlist_tracks_changed(db.session, current_user.id, pl.id, -1)
             db.session.commit()
             flash("Трек удалён из плейлиста", "info")
         return redirect(url_for("playlist_detail", pl_id=pl.id))
 
+    # --- JSON-API плейлиста: пакетное добавление/удаление без перерисовки страницы ---
+    @app.route("/api/playlists/<int:pl_id>/tracks", methods=["POST", "DELETE"])
+    @login_required
+    def api_playlist_tracks(pl_id: int):
+        """POST/DELETE {"track_ids": [...]}. Ответ — только изменённые строки и новый счётчик."""
+        pl = (db.session.query(Playlist)
+              .filter_by(id=pl_id, user_id=current_user.id)
+              .first_or_404())
+        data = request.get_json(silent=True) or {}
+        ids = data.get("track_ids")
+        if not isinstance(ids, list) or not ids or not all(isinstance(i, int) for i in ids):
+            return jsonify({"ok": False, "error": "track_ids"}), 400
+        ids = list(dict.fromkeys(ids))
+
+        if request.method == "DELETE":
+            removed = (db.session.query(Track.id, Track.title, Track.artist)
+                       .join(PlaylistTrack, PlaylistTrack.track_id == Track.id)
+                       .filter(PlaylistTrack.playlist_id == pl.id, Track.id.in_(ids))
+                       .all())
+            if removed:
+                (db.session.query(PlaylistTrack)
+                 .filter(PlaylistTrack.playlist_id == pl.id,
+                         PlaylistTrack.track_id.in_([r.id for r in removed]))
+                 .delete(synchronize_session=False))
+                libstats.playlist_tracks_changed(db.session, current_user.id, pl.id, -len(removed))
+                db.session.commit()
+            return jsonify({
+                "ok": True, "count": _playlist_count(pl.id),
+                "removed": [{"id": r.id, "title": r.title, "artist": r.artist} for r in removed],
+            })
+
+        # только свои треки, которых ещё нет в плейлисте
+        tracks = _addable_tracks(pl, ids)
+        _append_tracks(pl, tracks)
+        count = _playlist_count(pl.id)
+
+        items = [PlaylistTrack(playlist_id=pl.id, track_id=t.id, track=t) for t in tracks]
+        details = _catalog_details(tracks, modal="pl_modal")
+        item_row = get_template_attribute("_playlist_item.html", "item_row")
+        item_modal = get_template_attribute("_playlist_item.html", "item_modal")
+        first = count - len(items) + 1
+        return jsonify({
+            "ok": True, "count": count,
+            "added": [t.id for t in tracks],
+            "rows": "".join(str(item_row(pl, it, first + n)) for n, it in enumerate(items)),
+            "modals": "".join(str(item_modal(it, details.get(it.track_id))) for it in items),
+        })
+
     @app.post("/playlists/<int:pl_id>/delete")
     @login_required
     def playlist_delete(pl_id: int):
         pl = (db.session.query(Playlist)
               .filter_by(id=pl_id, user_id=current_user.id)
               .first_or_404())
-        # по желанию можно удалить файл обложки
-        try:
-            if pl.cover:
-                abs_path = Path(app.root_path) / "static" / pl.cover
-                if abs_path.exists():
-                    abs_path.unlink(missing_ok=True)
-        except Exception:
-            pass
+        cover = pl.cover
+        libstats.playlist_deleted(db.session, current_user.id, pl.id)
+        # строки playlist_tracks удаляет каскад в БД (passive_deletes), ORM их не грузит
         db.session.delete(pl)
         db.session.commit()
+        # файл обложки — только когда удаление точно зафиксировано
+        if cover:
+            remove_covers([cover], Path(app.root_path) / "static")
         flash("Плейлист удалён", "info")
         return redirect(url_for("playlists"))
 
@@ -284,9 +518,12 @@ def create_app():
                 if c:
                     title, artist = c.title, c.artist
 
-            track = Track(title=title, artist=artist, owner=current_user)
+            track = Track(title=title, artist=artist, owner=current_user,
+                          artist_id=artist_id_for(db.session, artist))
             try:
                 db.session.add(track)
+                libstats.tracks_added(db.session, current_user.id, [track])
+                db.session.flush()
                 db.session.commit()
                 flash("Трек добавлен", "success")
                 return redirect(url_for("songs"))
@@ -295,25 +532,25 @@ def create_app():
                 flash("Такой трек уже есть в вашем списке", "warning")
 
 
-        # фильтр по исполнителю 
+        # фильтр по исполнителю: точный ?artist_id= (ссылки со страниц) или подстрока ?artist=;
+        # подстрока ищется в маленькой таблице artists, треки — по индексу (user_id, artist_id).
+        # Ещё не связанные треки (artist_id IS NULL, link-artists не запускали) ищем по строке
+        artist_id = request.args.get("artist_id", type=int)
         artist_q = request.args.get("artist", "", type=str).strip()
         q = db.session.query(Track).filter(Track.user_id == current_user.id)
-        if artist_q:
-            q = q.filter(func.lower(Track.artist).contains(artist_q.lower()))
+        unlinked = Track.artist_id.is_(None)
+        if artist_id:
+            a = db.session.get(Artist, artist_id)
+            by_name = and_(unlinked, func.lower(func.trim(Track.artist)) == a.name_key) if a else false()
+            q = q.filter(or_(Track.artist_id == artist_id, by_name))
+            artist_q = a.name if a else artist_q
+        elif artist_q:
+            ids = artists_matching(artist_q).with_only_columns(Artist.id)
+            q = q.filter(or_(Track.artist_id.in_(ids),
+                             and_(unlinked, Track.artist.icontains(artist_q, autoescape=True))))
         tracks = q.order_by(Track.artist.asc(), Track.title.asc()).all()
 
-        details_by_track = {}
-        if tracks:
-            pairs = [(t.title.lower().strip(), t.artist.lower().strip()) for t in tracks]
-            cat_rows = (
-                db.session.query(Catalog)
-                .filter(
-                    tuple_(func.lower(Catalog.title), func.lower(Catalog.artist)).in_(pairs)
-                ).all()
-            )
-            cat_map = { (c.title.lower().strip(), c.artist.lower().strip()): c for c in cat_rows }
-            for t in tracks:
-                details_by_track[t.id] = cat_map.get((t.title.lower().strip(), t.artist.lower().strip()))
+        details_by_track = _catalog_details(tracks, modal="song_modal")
 
         return render_template(
             "songs.html",
@@ -329,6 +566,8 @@ def create_app():
             .filter_by(id=track_id, user_id=current_user.id)
             .first_or_404()
         )
+        libstats.track_playlists_changed(db.session, current_user.id, [track.id])
+        libstats.tracks_removed(db.session, current_user.id, [track])
         db.session.delete(track)
         db.session.commit()
         flash("Трек удалён", "info")
@@ -359,7 +598,11 @@ def create_app():
             flash("Трек не найден в каталоге", "warning")
             return redirect(url_for("lucky"))
         try:
-            db.session.add(Track(title=c.title, artist=c.artist, owner=current_user))
+            track = Track(title=c.title, artist=c.artist, owner=current_user,
+                          artist_id=c.artist_id or artist_id_for(db.session, c.artist))
+            db.session.add(track)
+            libstats.tracks_added(db.session, current_user.id, [track])
+            db.session.flush()
             db.session.commit()
             flash("Трек добавлен в ваш список", "success")
         except Exception:
@@ -367,6 +610,112 @@ def create_app():
             flash("Этот трек уже есть у вас", "info")
         return redirect(url_for("songs"))
 
+    # --- Импорт каталога через веб (выполняется воркером) ---
+    def _is_catalog_admin():
+        return current_user.email.lower() in app.config["CATALOG_ADMINS"]
+
+    @app.route("/catalog/import", methods=["GET", "POST"])
+    @login_required
+    def catalog_import():
+        if not _is_catalog_admin():
+            abort(403)
+        form = CatalogImportForm()
+        if form.validate_on_submit():
+            import_dir = Path(app.config["IMPORT_DIR"])
+            import_dir.mkdir(parents=True, exist_ok=True)
+            path = import_dir / f"{uuid4().hex}.csv"
+            form.file.data.save(path)
+            job = enqueue_job(db.session, "import-catalog",
+                              {"csv_path": str(path), "remove_after": True,
+                               "previews_dir": app.config["PREVIEWS_DIR"]},
+                              user_id=current_user.id)
+            flash(f"Импорт поставлен в очередь (задача #{job.id})", "success")
+            return redirect(url_for("catalog_import"))
+        jobs = (db.session.query(Job)
+                .filter_by(user_id=current_user.id, kind="import-catalog")
+                .order_by(Job.id.desc())
+                .limit(20)
+                .all())
+        return render_template("catalog_import.html", form=form, jobs=jobs)
+
+    # --- API статуса фоновых задач ---
+    @app.get("/api/jobs")
+    @login_required
+    def api_jobs():
+        jobs = (db.session.query(Job)
+                .filter_by(user_id=current_user.id)
+                .order_by(Job.id.desc())
+                .limit(50)
+                .all())
+        return jsonify([j.to_dict() for j in jobs])
+
+    @app.get("/api/jobs/<int:job_id>")
+    @login_required
+    def api_job(job_id: int):
+        job = (db.session.query(Job)
+               .filter_by(id=job_id, user_id=current_user.id)
+               .first_or_404())
+        return jsonify(job.to_dict())
+
+    @app.get("/api/fragments")
+    @login_required
+    def api_fragments():
+        """Счётчики кэша фрагментов этого процесса."""
+        if not _is_catalog_admin():
+            abort(403)
+        return jsonify({"pid": os.getpid(), **fragments.cache.stats()})
+
+    # --- Исполнители и альбомы ---
+    def _owned_titles(artist_id: int) -> set:
+        """Названия треков исполнителя в библиотеке пользователя (индекс user_id, artist_id)."""
+        rows = (db.session.query(Track.title)
+                .filter(Track.user_id == current_user.id, Track.artist_id == artist_id)
+                .all())
+        return {t.lower().strip() for (t,) in rows}
+
+    @app.get("/artists/<int:artist_id>")
+    @login_required
+    def artist_page(artist_id: int):
+        artist = db.session.get(Artist, artist_id) or abort(404)
+        albums = (db.session.query(Album.id, Album.title, Album.year)
+                  .filter(Album.artist_id == artist.id)
+                  .order_by(Album.year.asc(), Album.title.asc())
+                  .all())
+        rows = (db.session.query(Catalog.id, Catalog.title, Catalog.year, Catalog.album_id)
+                .filter(Catalog.artist_id == artist.id)
+                .order_by(Catalog.album_id.asc(), Catalog.year.asc(), Catalog.title.asc())
+                .all())
+        by_album = {}
+        for r in rows:
+            by_album.setdefault(r.album_id, []).append(r)
+        return render_template("artist.html", artist=artist, albums=albums, by_album=by_album,
+                               owned=_owned_titles(artist.id), total=len(rows))
+
+    @app.get("/albums/<int:album_id>")
+    @login_required
+    def album_page(album_id: int):
+        album = db.session.get(Album, album_id) or abort(404)
+        rows = (db.session.query(Catalog.id, Catalog.title, Catalog.year)
+                .filter(Catalog.album_id == album.id)
+                .order_by(Catalog.title.asc())
+                .all())
+        return render_template("album.html", album=album, artist=album.artist, rows=rows,
+                               owned=_owned_titles(album.artist_id))
+
+    @app.get("/catalog/<int:catalog_id>/preview")
+    @login_required
+    def catalog_preview(catalog_id: int):
+        """Аудио-превью трека каталога: Range/206, короткий кэш с перепроверкой по ETag."""
+        rel = (db.session.query(Catalog.preview_path)
+               .filter(Catalog.id == catalog_id)
+               .scalar())
+        path = safe_join(app.config["PREVIEWS_DIR"], rel) if rel else None
+        if not path or not os.path.isfile(path):
+            abort(404)
+        # соединение с БД не держим, пока отдаётся файл
+        db.session.remove()
+        return send_preview(path, accel_prefix=app.config["PREVIEW_ACCEL_REDIRECT"], rel_path=rel)
+
     # --- API для автодополнения ---
     @app.get("/api/suggest/artists")
     @login_required
@@ -374,15 +723,15 @@ def create_app():
         q = (request.args.get("q") or "").strip()
         if not q:
             return jsonify([])
-        rows = (
-            db.session.query(Catalog.artist)
-            .filter(func.lower(Catalog.artist).contains(q.lower()))
-            .distinct()
-            .order_by(Catalog.artist.asc())
+        # только исполнители, у которых есть треки в каталоге (проверка по ix_catalog_artist_album)
+        in_catalog = db.session.query(Catalog.id).filter(Catalog.artist_id == Artist.id).exists()
+        rows = db.session.execute(
+            artists_matching(q)
+            .where(in_catalog)
+            .order_by(Artist.name_key.asc())
             .limit(10)
-            .all()
-        )
-        return jsonify([r[0] for r in rows])
+        ).all()
+        return jsonify([r.name for r in rows])
 
     @app.get("/api/suggest/tracks")
     @login_required
@@ -395,7 +744,8 @@ def create_app():
             func.lower(Catalog.title).contains(q.lower())
         )
         if artist:
-            query = query.filter(func.lower(Catalog.artist) == artist.lower())
+            artist_ids = db.session.query(Artist.id).filter(Artist.name_key == artist.lower())
+            query = query.filter(Catalog.artist_id.in_(artist_ids.scalar_subquery()))
         rows = query.distinct().order_by(Catalog.title.asc()).limit(10).all()
         return jsonify([r[0] for r in rows])
 
@@ -407,7 +757,8 @@ def create_app():
         print("Каталог наполнен демо-данными.")
 
     @app.cli.command("load-catalog")
-    def load_catalog_cmd():
+    @click.option("--background", is_flag=True, help="Поставить импорт в очередь задач (flask worker).")
+    def load_catalog_cmd(background):
         """Импорт каталога из data/catalog.csv.
         Формат: title,artist[,year[,album[,lyrics_or_path]]]
         5-я колонка: либо текст песни, либо относительный путь к файлу
@@ -418,99 +769,140 @@ def create_app():
             print("Файл data/catalog.csv не найден")
             return
 
-        def to_int_safe(x):
-            try: return int(str(x).strip())
-            except: return None
-
-        def read_lyrics_from_path(val: str | None, artist: str, title: str) -> str | None:
-            """Если val похоже на имя файла — читаем его; иначе пытаемся автофайл '<artist> - <title>.txt'."""
-            base_dir = Path("data/lyrics")
-            # явный путь в CSV
-            if val:
-                p = Path(val)
-                if not p.is_absolute():
-                    p = base_dir / p
-                if p.exists() and p.is_file():
-                    try:
-                        return p.read_text(encoding="utf-8")
-                    except Exception:
-                        return None
-                # если строка не путь/файл — трактуем как прямой текст
-                if val.strip() and not any(val.lower().endswith(ext) for ext in (".txt", ".md", ".lrc")):
-                    return val
-            # авто-поиск по шаблону
-            auto = base_dir / f"{artist} - {title}.txt"
-            if auto.exists():
-                try:
-                    return auto.read_text(encoding="utf-8")
-                except Exception:
-                    return None
-            return None
-
-        added = updated = skipped = 0
-
-        with csv_path.open("r", encoding="utf-8", newline="") as f:
-            reader = csv.reader(f)
-
-            # пытаемся распознать заголовок
-            first_row = next(reader, None)
-            if first_row is None:
-                print("Пустой CSV")
-                return
-
-            has_header = (
-                len(first_row) >= 2 and
-                first_row[0].strip().lower() in ("title", "название", "трек") and
-                first_row[1].strip().lower() in ("artist", "исполнитель")
-            )
-            rows_iter = reader if has_header else [first_row] + list(reader)
-
-            for row in rows_iter:
-                if not row or all(not (c or "").strip() for c in row):
-                    continue
-
-                title  = (row[0] or "").strip()
-                artist = (row[1] or "").strip()
-                year   = to_int_safe(row[2]) if len(row) >= 3 and row[2] else None
-                album  = (row[3] or "").strip() if len(row) >= 4 else None
-                lyr_raw = (row[4] or "").strip() if len(row) >= 5 else ""
-
-                if not title or not artist:
-                    continue
-
-                # читаем текст (из файла/строки/автофайла)
-                lyrics = read_lyrics_from_path(lyr_raw, artist, title)
-                if lyrics:
-                    lyrics = lyrics[:50000]  # безопасный лимит
+        if background:
+            job = enqueue_job(db.session, "import-catalog", {"csv_path": str(csv_path.resolve()),
+                                                             "previews_dir": app.config["PREVIEWS_DIR"]})
+            print(f"Импорт поставлен в очередь, задача #{job.id}. Запустите: flask worker")
+            return
+        if csv_path.stat().st_size == 0:
+            print("Пустой CSV")
+            return
 
-                existing = (
-                    db.session.query(Catalog)
-                    .filter(func.lower(Catalog.title) == title.lower(),
-                            func.lower(Catalog.artist) == artist.lower())
-                    .first()
-                )
+        stats = import_catalog(db.session, csv_path, previews_dir=app.config["PREVIEWS_DIR"])
+        print(f"✅ Импорт завершён. Добавлено: {stats['added']}, обновлено: {stats['updated']}, "
+              f"пропущено: {stats['skipped']}")
+
+    @app.cli.command("sync-catalog")
+    @click.option("--policy", type=click.Choice(["fill", "overwrite", "mirror"]), default="fill",
+                  show_default=True, help="Как обновлять уже существующие строки.")
+    @click.option("--prune/--no-prune", default=True, show_default=True,
+                  help="Удалять из каталога строки, пропавшие из CSV.")
+    @click.option("--batch-size", default=1000, show_default=True)
+    @click.option("--dry-run", is_flag=True, help="Только посчитать разницу.")
+    @click.option("--background", is_flag=True, help="Поставить в очередь задач (flask worker).")
+    def sync_catalog_cmd(policy, prune, batch_size, dry_run, background):
+        """Инкрементальная синхронизация с data/catalog.csv: применяется только
+        разница с прошлым запуском (новые, изменённые, удалённые строки).
+        """
+        csv_path = Path("data/catalog.csv")
+        if not csv_path.exists():
+            print("Файл data/catalog.csv не найден")
+            return
+        if background:
+            job = enqueue_job(db.session, "sync-catalog",
+                              {"csv_path": str(csv_path.resolve()), "policy": policy, "prune": prune})
+            print(f"Синхронизация поставлена в очередь, задача #{job.id}. Запустите: flask worker")
+            return
 
-                if existing:
-                    changed = False
-                    if year and not existing.year:
-                        existing.year = year; changed = True
-                    if album and not (existing.album or "").strip():
-                        existing.album = album; changed = True
-                    if lyrics and not (existing.lyrics or "").strip():
-                        existing.lyrics = lyrics; changed = True
-                    if changed: updated += 1
-                    else: skipped += 1
-                else:
-                    db.session.add(Catalog(
-                        title=title, artist=artist, year=year,
-                        album=(album or None),
-                        lyrics=(lyrics or None)
-                    ))
-                    added += 1
+        stats = sync_catalog(db.session, csv_path, policy=policy, prune=prune,
+                             batch_size=batch_size, dry_run=dry_run)
+        print(f"Новых: {stats['new']}, изменённых: {stats['changed']}, удалённых: {stats['removed']}, "
+              f"без изменений: {stats['unchanged']}")
+        if not dry_run:
+            print(f"✅ Синхронизация завершена. Добавлено: {stats['added']}, обновлено: {stats['updated']}, "
+                  f"удалено: {stats['deleted']}")
+
+    @app.cli.command("dump-catalog")
+    @click.argument("out_dir", required=False)
+    @click.option("--format", "fmt", type=click.Choice(["csv", "binary"]), default="csv", show_default=True,
+                  help="binary — COPY (FORMAT binary), восстанавливается только в PostgreSQL.")
+    def dump_catalog_cmd(out_dir, fmt):
+        """Снимок каталога (данные + manifest.json с контрольной суммой)."""
+        out_dir = out_dir or f"data/snapshots/catalog-{datetime.now():%Y%m%d-%H%M%S}"
+        manifest = dump_catalog(db.engine, out_dir, fmt)
+        print(f"✅ Снимок записан в {out_dir}: строк {manifest['rows']}, {manifest['bytes'] // 1024} КБ")
+
+    @app.cli.command("restore-catalog")
+    @click.argument("snap_dir")
+    @click.option("--yes", is_flag=True, help="Не спрашивать подтверждение.")
+    def restore_catalog_cmd(snap_dir, yes):
+        """Заменить каталог снимком из dump-catalog (индексы перестраиваются после загрузки)."""
+        try:
+            manifest = read_manifest(snap_dir)
+        except (OSError, ValueError) as e:
+            print(f"Снимок не прошёл проверку: {e}")
+            return
+        if not yes and not click.confirm(f"Заменить каталог {manifest['rows']} строками из снимка?"):
+            return
+        stats = restore_catalog(db.engine, snap_dir)
+        linked = link_catalog(db.session)
+        print(f"✅ Каталог восстановлен: строк {stats['rows']}, связано с исполнителями {linked}")
+
+    @app.cli.command("link-artists")
+    def link_artists_cmd():
+        """Проставить artist_id/album_id строкам каталога и трекам, где их нет."""
+        cat = link_catalog(db.session)
+        tracks = link_tracks(db.session)
+        print(f"✅ Связано: строк каталога {cat}, треков {tracks}")
+
+    @app.cli.command("delete-user")
+    @click.argument("email")
+    @click.option("--yes", is_flag=True, help="Не спрашивать подтверждение.")
+    def delete_user_cmd(email, yes):
+        """Удалить пользователя со всеми треками и плейлистами."""
+        user = db.session.query(User).filter_by(email=email.lower().strip()).first()
+        if not user:
+            print(f"Пользователь {email} не найден")
+            return
+        if not yes:
+            click.confirm(f"Удалить {user.email} и все его данные?", abort=True)
+        res = delete_account(db.session, user.id, Path(app.root_path) / "static")
+        print(f"✅ Удалено: треков {res['tracks']}, плейлистов {res['playlists']}, "
+              f"связей {res['playlist_tracks']}, обложек {res['covers']}")
+
+    @app.cli.command("rebuild-stats")
+    @click.option("--user-id", "user_ids", type=int, multiple=True, help="Только эти пользователи.")
+    def rebuild_stats_cmd(user_ids):
+        """Пересчитать агрегаты статистики из исходных таблиц (бэкфилл)."""
+        n = libstats.rebuild(db.session, list(user_ids) or None)
+        print(f"✅ Статистика пересчитана, пользователей: {n}")
+
+    @app.cli.command("worker")
+    @click.option("--processes", default=2, show_default=True, help="Размер пула процессов.")
+    @click.option("--poll", default=1.0, show_default=True, help="Пауза опроса очереди, сек.")
+    @click.option("--once", is_flag=True, help="Выполнить всё, что в очереди, и выйти.")
+    def worker_cmd(processes, poll, once):
+        """Запустить обработчик фоновых задач (импорт каталога и т.п.)."""
+        run_worker(db.session, processes=processes, poll=poll, once=once)
+
+    @app.cli.command("dedupe-catalog")
+    @click.option("--threshold", default=0.85, show_default=True, help="Порог похожести (триграммы, 0..1).")
+    @click.option("--max-block", default=200, show_default=True, help="Блоки крупнее пропускаются.")
+    @click.option("--report", "report_path", default="data/dedupe_report.csv", show_default=True)
+    @click.option("--apply", "apply_", is_flag=True, help="Слить найденные кластеры.")
+    @click.option("--yes", is_flag=True, help="Не спрашивать подтверждение.")
+    def dedupe_catalog_cmd(threshold, max_block, report_path, apply_, yes):
+        """Найти почти-дубликаты в Catalog, записать отчёт и (с --apply) слить их.
+        Треки пользователей переименовываются в эталонные title/artist пачками.
+        """
+        from dedupe import find_clusters, write_report, merge_clusters
 
-            db.session.commit()
+        clusters, by_id = find_clusters(db.session, threshold=threshold, max_block=max_block)
+        if not clusters:
+            print("Дубликатов не найдено.")
+            return
+        write_report(clusters, by_id, report_path)
+        dupes = sum(len(c.ids) - 1 for c in clusters)
+        print(f"Кластеров: {len(clusters)}, лишних строк: {dupes}. Отчёт: {report_path}")
 
-        print(f"✅ Импорт завершён. Добавлено: {added}, обновлено: {updated}, пропущено: {skipped}")
+        if not apply_:
+            print("Для слияния запустите с --apply")
+            return
+        if not yes and not click.confirm("Слить кластеры из отчёта?"):
+            return
+        stats = merge_clusters(db.session, clusters)
+        print(f"✅ Слияние завершено. Удалено из каталога: {stats['catalog_removed']}, "
+              f"переименовано треков: {stats['tracks_renamed']}, удалено треков-дублей: {stats['tracks_removed']}")
 
     return app    
 
@@ -0,0 +1,190 @@
+"""Нормализованные исполнители и альбомы.
+
+Строки artist/album в Catalog и Track остаются как есть (их видит
+пользователь), а рядом хранятся целочисленные artist_id/album_id.
+Фильтры, подсказки и страницы дискографий работают по ним и по
+покрывающим индексам вместо lower(artist) LIKE / DISTINCT по строкам.
+Связывание идёт пачками и только по строкам с artist_id IS NULL, поэтому
+его можно безопасно перезапускать.
+"""
+from sqlalchemy import Column, Integer, MetaData, String, Table, bindparam, func, insert, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from models import Album, Artist, Catalog, Track
+
+BATCH = 5000
+IN_CHUNK = 1000
+
+
+def artist_key(name: str) -> str:
+    return name.strip().lower()
+
+
+def album_key(title: str) -> str:
+    return title.strip().lower()
+
+
+def _insert_ignore(session, model, rows, index_elements):
+    if not rows:
+        return
+    make = pg_insert if session.get_bind().dialect.name == "postgresql" else sqlite_insert
+    stmt = make(model.__table__).on_conflict_do_nothing(index_elements=index_elements)
+    session.execute(stmt, rows)
+
+
+def ensure_artists(session, names) -> dict:
+    """{name_key: artist_id} для всех имён; недостающие исполнители создаются."""
+    wanted = {}
+    for n in names:
+        if n and n.strip():
+            wanted.setdefault(artist_key(n), n.strip())
+    ids = {}
+    keys = list(wanted)
+    for start in range(0, len(keys), IN_CHUNK):
+        part = keys[start:start + IN_CHUNK]
+        ids.update(session.execute(select(Artist.name_key, Artist.id)
+                                   .where(Artist.name_key.in_(part))).all())
+    missing = [k for k in keys if k not in ids]
+    if missing:
+        _insert_ignore(session, Artist, [{"name": wanted[k], "name_key": k} for k in missing], ["name_key"])
+        for start in range(0, len(missing), IN_CHUNK):
+            part = missing[start:start + IN_CHUNK]
+            ids.update(session.execute(select(Artist.name_key, Artist.id)
+                                       .where(Artist.name_key.in_(part))).all())
+    return ids
+
+
+def ensure_albums(session, items) -> dict:
+    """items — (artist_id, title, year). Вернуть {(artist_id, title_key): album_id}."""
+    wanted = {}
+    for artist_id, title, year in items:
+        if artist_id and title and title.strip():
+            key = (artist_id, album_key(title))
+            cur = wanted.get(key)
+            if cur is None or (year and (not cur[1] or year < cur[1])):
+                wanted[key] = (title.strip(), year)
+
+    def fetch(keys):
+        found = {}
+        by_artist = {}
+        for a, t in keys:
+            by_artist.setdefault(a, []).append(t)
+        artist_ids = list(by_artist)
+        for start in range(0, len(artist_ids), IN_CHUNK):
+            part = artist_ids[start:start + IN_CHUNK]
+            for a, t, i in session.execute(select(Album.artist_id, Album.title_key, Album.id)
+                                           .where(Album.artist_id.in_(part))):
+                if (a, t) in wanted:
+                    found[(a, t)] = i
+        return found
+
+    ids = fetch(list(wanted))
+    missing = [k for k in wanted if k not in ids]
+    if missing:
+        _insert_ignore(session, Album,
+                       [{"artist_id": a, "title_key": t, "title": wanted[(a, t)][0], "year": wanted[(a, t)][1]}
+                        for a, t in missing],
+                       ["artist_id", "title_key"])
+        ids.update(fetch(missing))
+    return ids
+
+
+def artist_id_for(session, name: str) -> int | None:
+    """Один исполнитель (добавление трека из формы)."""
+    return ensure_artists(session, [name]).get(artist_key(name)) if name and name.strip() else None
+
+
+# соответствие (исполнитель, альбом) как они записаны в каталоге -> id; временная таблица
+# на одну пачку, чтобы связать строки одним UPDATE ... FROM, а не по строке
+_LINK_MAP = Table(
+    "_catalog_link_map", MetaData(),
+    Column("artist", String(255), primary_key=True),
+    Column("album", String(255), primary_key=True),    # '' — альбома нет
+    Column("artist_id", Integer, nullable=False),
+    Column("album_id", Integer),
+    prefixes=["TEMPORARY"],
+)
+
+
+def link_catalog(session, batch_size: int = BATCH, progress=None) -> int:
+    """Проставить artist_id/album_id строкам каталога, где их ещё нет.
+    Python видит только различные пары (artist, album), строки каталога
+    обновляются набором. Version не меняется: ключ кэша фрагментов уже
+    включает artist_id/album_id, а превью от связей не зависят."""
+    cat = Catalog.__table__
+    album = func.coalesce(cat.c.album, "")
+    pairs = session.execute(
+        select(cat.c.artist, album, func.min(cat.c.year))
+        .where(cat.c.artist_id.is_(None))
+        .group_by(cat.c.artist, album)
+        .order_by(cat.c.artist, album)
+    ).all()
+    linked = 0
+    for start in range(0, len(pairs), batch_size):
+        batch = pairs[start:start + batch_size]
+        artists = ensure_artists(session, [a for a, _, _ in batch])
+        albums = ensure_albums(session, [(artists.get(artist_key(a)), al, y) for a, al, y in batch])
+        rows = []
+        for a, al, _ in batch:
+            aid = artists.get(artist_key(a))
+            if aid is not None:
+                rows.append({"artist": a, "album": al, "artist_id": aid,
+                             "album_id": albums.get((aid, album_key(al))) if al else None})
+        if rows:
+            conn = session.connection()
+            _LINK_MAP.create(conn)
+            session.execute(insert(_LINK_MAP), rows)
+            res = session.execute(
+                update(cat)
+                .where(cat.c.artist_id.is_(None),
+                       cat.c.artist == _LINK_MAP.c.artist, album == _LINK_MAP.c.album)
+                .values(artist_id=_LINK_MAP.c.artist_id, album_id=_LINK_MAP.c.album_id)
+            )
+            _LINK_MAP.drop(conn)
+            linked += res.rowcount
+        session.commit()
+        if progress:
+            progress(linked)
+    return linked
+
+
+def link_tracks(session, batch_size: int = BATCH, user_id: int | None = None) -> int:
+    """Проставить artist_id трекам пользователей, где его ещё нет."""
+    table = Track.__table__
+    stmt = update(table).where(table.c.id == bindparam("tid")).values(artist_id=bindparam("aid"))
+    last_id, linked = 0, 0
+    while True:
+        q = (select(Track.id, Track.artist)
+             .where(Track.artist_id.is_(None), Track.id > last_id)
+             .order_by(Track.id)
+             .limit(batch_size))
+        if user_id is not None:
+            q = q.where(Track.user_id == user_id)
+        rows = session.execute(q).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        artists = ensure_artists(session, [r.artist for r in rows])
+        params = [{"tid": r.id, "aid": artists[artist_key(r.artist)]}
+                  for r in rows if artist_key(r.artist) in artists]
+        if params:
+            session.execute(stmt, params)
+        session.commit()
+        linked += len(params)
+    return linked
+
+
+def unlink(row) -> None:
+    """Сбросить связи у строки каталога, у которой поменялся artist/album (перелинкуется позже)."""
+    row.artist_id = None
+    row.album_id = None
+
+
+def artists_matching(q: str, prefix: bool = False):
+    """SELECT id, name исполнителей, чьё имя содержит q (или начинается с q).
+    Ищем по маленькой таблице artists, а не по строкам всех треков."""
+    key = artist_key(q)
+    cond = (Artist.name_key.startswith(key, autoescape=True) if prefix
+            else Artist.name_key.contains(key, autoescape=True))
+    return select(Artist.id, Artist.name).where(cond)
@@ -0,0 +1,112 @@
+"""Бенчмарк удаления аккаунта: ORM-каскад против удаления на стороне БД.
+
+Запуск (в контейнере web, база из DATABASE_URL):
+    python bench_delete_user.py                      # 100k треков, 1k плейлистов
+    python bench_delete_user.py --tracks 20000 --playlists 200 --mode bulk
+
+Режимы:
+  orm     — как было до passive_deletes: ORM грузит все треки, плейлисты
+            и их строки и удаляет каждую отдельным DELETE;
+  passive — session.delete(user): одна строка, остальное — ON DELETE CASCADE;
+  bulk    — accounts.delete_account(): пачки DELETE от листьев к корню.
+"""
+import argparse
+import time
+from uuid import uuid4
+
+from sqlalchemy import func, insert
+
+from app import app, db
+from accounts import delete_account
+from models import Playlist, PlaylistTrack, Track, User
+from ordering import spread
+
+CHUNK = 10000
+
+
+def seed(n_tracks: int, n_playlists: int, per_playlist: int) -> int:
+    user = User(email=f"bench-{uuid4().hex[:8]}@example.com")
+    user.set_password("benchmark")
+    db.session.add(user)
+    db.session.commit()
+
+    rows = [{"title": f"Track {i}", "artist": f"Artist {i % 5000}", "user_id": user.id}
+            for i in range(n_tracks)]
+    for start in range(0, len(rows), CHUNK):
+        db.session.execute(insert(Track), rows[start:start + CHUNK])
+    db.session.execute(insert(Playlist), [{"user_id": user.id, "title": f"Playlist {i}"}
+                                          for i in range(n_playlists)])
+    db.session.commit()
+
+    track_ids = [i for (i,) in db.session.query(Track.id).filter_by(user_id=user.id).order_by(Track.id)]
+    pl_ids = [i for (i,) in db.session.query(Playlist.id).filter_by(user_id=user.id).order_by(Playlist.id)]
+    ranks = spread(per_playlist)
+    links = []
+    for n, pl_id in enumerate(pl_ids):
+        offset = n * per_playlist
+        for k in range(per_playlist):
+            links.append({"playlist_id": pl_id, "track_id": track_ids[(offset + k) % len(track_ids)],
+                          "rank": ranks[k]})
+            if len(links) >= CHUNK:
+                db.session.execute(insert(PlaylistTrack), links)
+                links = []
+    if links:
+        db.session.execute(insert(PlaylistTrack), links)
+    db.session.commit()
+    return user.id
+
+
+def delete_orm(user_id: int):
+    # прежнее поведение: загрузить всех детей и удалить построчно
+    user = db.session.get(User, user_id)
+    for pl in user.playlists:
+        for it in pl.items:
+            db.session.delete(it)
+        db.session.delete(pl)
+    for t in user.tracks:
+        db.session.delete(t)
+    db.session.delete(user)
+    db.session.commit()
+
+
+def delete_passive(user_id: int):
+    db.session.delete(db.session.get(User, user_id))
+    db.session.commit()
+
+
+def delete_bulk(user_id: int):
+    delete_account(db.session, user_id)
+
+
+MODES = {"orm": delete_orm, "passive": delete_passive, "bulk": delete_bulk}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tracks", type=int, default=100_000)
+    parser.add_argument("--playlists", type=int, default=1_000)
+    parser.add_argument("--per-playlist", type=int, default=100)
+    parser.add_argument("--mode", choices=[*MODES, "all"], default="all")
+    args = parser.parse_args()
+
+    modes = list(MODES) if args.mode == "all" else [args.mode]
+    with app.app_context():
+        print(f"БД: {db.engine.dialect.name}; треков {args.tracks}, плейлистов {args.playlists}, "
+              f"по {args.per_playlist} треков в каждом")
+        for mode in modes:
+            t0 = time.perf_counter()
+            user_id = seed(args.tracks, args.playlists, args.per_playlist)
+            seeded = time.perf_counter() - t0
+
+            db.session.expunge_all()
+            t0 = time.perf_counter()
+            MODES[mode](user_id)
+            elapsed = time.perf_counter() - t0
+
+            left = (db.session.query(func.count(Track.id)).filter_by(user_id=user_id).scalar()
+                    + db.session.query(func.count(Playlist.id)).filter_by(user_id=user_id).scalar())
+            print(f"{mode:8s} удаление {elapsed:8.2f} с   (наполнение {seeded:.1f} с, осталось строк: {left})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""Импорт каталога из CSV (общий код для CLI load-catalog и фоновых задач).
+
+Формат: title,artist[,year[,album[,lyrics_or_path]]]
+5-я колонка: либо текст песни, либо относительный путь к файлу
+в data/lyrics (например: "Imagine Dragons - Radioactive.txt").
+"""
+import csv
+from pathlib import Path
+
+from sqlalchemy import func
+
+from artists import link_catalog, unlink
+from models import Catalog
+from previews import index_previews
+
+LYRICS_DIR = Path("data/lyrics")
+PREVIEWS_DIR = Path("data/previews")    # файлы вида "<artist> - <title>.mp3"
+LYRICS_LIMIT = 50000  # безопасный лимит
+
+
+def to_int_safe(x):
+    try: return int(str(x).strip())
+    except: return None
+
+
+def lyrics_source(val: str | None, artist: str, title: str, base_dir: Path = LYRICS_DIR):
+    """Откуда брать текст, не читая файл: (path, None) — файл,
+    (None, text) — текст прямо в CSV, (None, None) — текста нет."""
+    # явный путь в CSV
+    if val:
+        p = Path(val)
+        if not p.is_absolute():
+            p = base_dir / p
+        if p.exists() and p.is_file():
+            return p, None
+        # если строка не путь/файл — трактуем как прямой текст
+        if val.strip() and not any(val.lower().endswith(ext) for ext in (".txt", ".md", ".lrc")):
+            return None, val
+    # авто-поиск по шаблону
+    auto = base_dir / f"{artist} - {title}.txt"
+    if auto.exists():
+        return auto, None
+    return None, None
+
+
+def read_lyrics_from_path(val: str | None, artist: str, title: str, base_dir: Path = LYRICS_DIR) -> str | None:
+    """Если val похоже на имя файла — читаем его; иначе пытаемся автофайл '<artist> - <title>.txt'."""
+    path, text = lyrics_source(val, artist, title, base_dir)
+    if path is None:
+        return text
+    try:
+        return path.read_text(encoding="utf-8")
+    except Exception:
+        return None
+
+
+def read_rows(csv_path: Path) -> list:
+    """Строки CSV без заголовка (если он есть)."""
+    with Path(csv_path).open("r", encoding="utf-8", newline="") as f:
+        rows = list(csv.reader(f))
+    if not rows:
+        return rows
+    # пытаемся распознать заголовок
+    first_row = rows[0]
+    has_header = (
+        len(first_row) >= 2 and
+        first_row[0].strip().lower() in ("title", "название", "трек") and
+        first_row[1].strip().lower() in ("artist", "исполнитель")
+    )
+    return rows[1:] if has_header else rows
+
+
+def parse_row(row):
+    """(title, artist, year, album, lyr_raw) или None для пустой/битой строки."""
+    if not row or all(not (c or "").strip() for c in row):
+        return None
+    title  = (row[0] or "").strip()
+    artist = (row[1] or "").strip() if len(row) >= 2 else ""
+    year   = to_int_safe(row[2]) if len(row) >= 3 and row[2] else None
+    album  = (row[3] or "").strip() if len(row) >= 4 else None
+    lyr_raw = (row[4] or "").strip() if len(row) >= 5 else ""
+    if not title or not artist:
+        return None
+    return title, artist, year, album, lyr_raw
+
+
+def import_catalog(session, csv_path, lyrics_dir=LYRICS_DIR, progress=None,
+                   previews_dir=PREVIEWS_DIR) -> dict:
+    """Добавить новые строки каталога и дозаполнить пустые year/album/lyrics.
+    Превью ищутся в previews_dir по имени "<artist> - <title>.<ext>".
+    progress(done, total) вызывается периодически (для фоновых задач).
+    """
+    previews = index_previews(previews_dir)
+    rows = read_rows(csv_path)
+    total = len(rows)
+    added = updated = skipped = 0
+
+    for n, row in enumerate(rows, 1):
+        if progress and n % 500 == 0:
+            progress(n, total)
+        parsed = parse_row(row)
+        if not parsed:
+            continue
+        title, artist, year, album, lyr_raw = parsed
+
+        # читаем текст (из файла/строки/автофайла)
+        lyrics = read_lyrics_from_path(lyr_raw, artist, title, Path(lyrics_dir))
+        if lyrics:
+            lyrics = lyrics[:LYRICS_LIMIT]
+        preview = previews.get(f"{artist} - {title}".lower())
+
+        existing = (
+            session.query(Catalog)
+            .filter(func.lower(Catalog.title) == title.lower(),
+                    func.lower(Catalog.artist) == artist.lower())
+            .first()
+        )
+
+        if existing:
+            changed = False
+            if year and not existing.year:
+                existing.year = year; changed = True
+            if album and not (existing.album or "").strip():
+                existing.album = album; changed = True
+                unlink(existing)
+            if lyrics and not (existing.lyrics or "").strip():
+                existing.lyrics = lyrics; changed = True
+            # превью — производное от содержимого data/previews, следуем за ним
+            if preview and existing.preview_path != preview:
+                existing.preview_path = preview; changed = True
+            if changed: updated += 1
+            else: skipped += 1
+        else:
+            session.add(Catalog(
+                title=title, artist=artist, year=year,
+                album=(album or None),
+                lyrics=(lyrics or None),
+                preview_path=preview
+            ))
+            added += 1
+
+    session.commit()
+    # исполнители/альбомы для новых и изменённых строк
+    link_catalog(session)
+    if progress:
+        progress(total, total)
+    return {"added": added, "updated": updated, "skipped": skipped}
@@ -0,0 +1,234 @@
+"""Инкрементальная синхронизация Catalog с data/catalog.csv.
+
+В catalog_sync_state хранится хэш каждой строки CSV и отпечаток файла
+текста (путь, mtime, размер, sha1). Один проход по CSV даёт разницу
+(новые / изменённые / удалённые), и применяется только она — пачками.
+Файлы текстов читаются, только если их mtime/размер изменились.
+"""
+import hashlib
+from pathlib import Path
+
+from sqlalchemy import delete, insert, tuple_, update
+
+from artists import link_catalog, unlink
+from catalog_import import LYRICS_DIR, LYRICS_LIMIT, lyrics_source, parse_row, read_rows
+from fragments import bump_generation
+from models import Catalog, CatalogSyncState, utcnow
+
+# fill      — как load-catalog: заполняем только пустые поля
+# overwrite — непустые значения из CSV заменяют текущие
+# mirror    — каталог повторяет CSV, пустое значение в CSV очищает поле
+POLICIES = ("fill", "overwrite", "mirror")
+
+
+def _sha1(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def _read(path) -> str | None:
+    try:
+        return Path(path).read_text(encoding="utf-8")
+    except Exception:
+        return None
+
+
+def _apply_policy(c: Catalog, item: dict, policy: str) -> bool:
+    if (c.title.lower().strip(), c.artist.lower().strip()) != item["key"]:
+        # состояние ведёт на чужую строку (dedupe-catalog склеил варианты): вариант
+        # из CSV не переписывает оставленную запись, а только дополняет пустые поля
+        policy = "fill"
+    changed = False
+    before = (c.artist, c.album)
+    fields = [("year", item["year"]), ("album", item["album"]), ("lyrics", item["lyrics"])]
+    if policy != "fill":
+        fields += [("title", item["title"]), ("artist", item["artist"])]
+    for field, val in fields:
+        cur = getattr(c, field)
+        if policy == "fill":
+            empty = not (cur.strip() if isinstance(cur, str) else cur)
+            if val and empty:
+                setattr(c, field, val); changed = True
+        elif policy == "overwrite":
+            if val and val != cur:
+                setattr(c, field, val); changed = True
+        elif val != cur:
+            setattr(c, field, val); changed = True
+    if (c.artist, c.album) != before:
+        unlink(c)                      # artist_id/album_id проставит link_catalog()
+    return changed
+
+
+def _state_row(item: dict) -> dict:
+    return {
+        "title_key": item["key"][0], "artist_key": item["key"][1],
+        "catalog_id": item["catalog_id"], "row_hash": item["row_hash"],
+        "lyrics_path": item["lyrics_path"], "lyrics_mtime": item["lyrics_mtime"],
+        "lyrics_size": item["lyrics_size"], "lyrics_hash": item["lyrics_hash"],
+        "synced_at": utcnow(),
+    }
+
+
+def diff_catalog(session, csv_path, lyrics_dir=LYRICS_DIR, prune: bool = True):
+    """Один проход по CSV против сохранённого состояния: (new, changed, touched, removed, unchanged)."""
+    base_dir = Path(lyrics_dir)
+    state = {
+        (s.title_key, s.artist_key): s
+        for s in session.query(CatalogSyncState.title_key, CatalogSyncState.artist_key,
+                               CatalogSyncState.catalog_id, CatalogSyncState.row_hash,
+                               CatalogSyncState.lyrics_path, CatalogSyncState.lyrics_mtime,
+                               CatalogSyncState.lyrics_size, CatalogSyncState.lyrics_hash)
+                        .execution_options(yield_per=10000)
+    }
+    new, changed, touched = [], [], []
+    seen = set()
+    unchanged = 0
+
+    for row in read_rows(csv_path):
+        parsed = parse_row(row)
+        if not parsed:
+            continue
+        title, artist, year, album, lyr_raw = parsed
+        key = (title.lower(), artist.lower())
+        if key in seen:                # повтор в CSV: как и раньше, главная — первая строка
+            continue
+        seen.add(key)
+
+        path, text = lyrics_source(lyr_raw, artist, title, base_dir)
+        st = path.stat() if path else None
+        item = {
+            "key": key, "title": title, "artist": artist, "year": year, "album": album or None,
+            "row_hash": _sha1("\x1f".join([title, artist, str(year or ""), album or "", lyr_raw])),
+            "inline": text, "lyrics_path": str(path) if path else None,
+            "lyrics_mtime": st.st_mtime if st else None, "lyrics_size": st.st_size if st else None,
+            "lyrics_hash": _sha1(text) if text else None, "catalog_id": None, "has_state": False,
+        }
+        old = state.get(key)
+        if old is None or old.catalog_id is None:
+            # строку каталога удалили в обход sync (dedupe-catalog, вручную) —
+            # ищем её заново по ключу, состояние обновится, а не вставится
+            item["has_state"] = old is not None
+            new.append(item)
+            continue
+
+        item["catalog_id"] = old.catalog_id
+        item["has_state"] = True
+        same_file = (item["lyrics_path"] == old.lyrics_path
+                     and item["lyrics_mtime"] == old.lyrics_mtime
+                     and item["lyrics_size"] == old.lyrics_size)
+        if same_file:
+            if old.row_hash == item["row_hash"]:
+                unchanged += 1
+                continue
+            if path:
+                item["lyrics_hash"] = old.lyrics_hash
+        elif path:
+            lyrics = _read(path)
+            item["lyrics"] = lyrics
+            item["lyrics_hash"] = _sha1(lyrics) if lyrics else None
+            if old.row_hash == item["row_hash"] and item["lyrics_hash"] == old.lyrics_hash:
+                touched.append(item)   # файл «потрогали», содержимое то же
+                continue
+        changed.append(item)
+
+    removed = []
+    if prune:
+        # после dedupe-catalog на одну строку каталога ссылаются несколько строк CSV:
+        # её удаляем, только когда из CSV пропали все они
+        kept = {s.catalog_id for k, s in state.items() if k in seen}
+        removed = [(k, s.catalog_id if s.catalog_id not in kept else None)
+                   for k, s in state.items() if k not in seen]
+    return new, changed, touched, removed, unchanged
+
+
+def _lyrics(item: dict) -> str | None:
+    if "lyrics" not in item:
+        if item["inline"]:
+            item["lyrics"] = item["inline"]
+        elif item["lyrics_path"]:
+            item["lyrics"] = _read(item["lyrics_path"])
+            item["lyrics_hash"] = _sha1(item["lyrics"]) if item["lyrics"] else None
+        else:
+            item["lyrics"] = None
+    text = item["lyrics"]
+    return text[:LYRICS_LIMIT] if text else None
+
+
+def sync_catalog(session, csv_path, lyrics_dir=LYRICS_DIR, policy: str = "fill", prune: bool = True,
+                 batch_size: int = 1000, dry_run: bool = False, progress=None) -> dict:
+    """Применить к Catalog только разницу с прошлой синхронизацией."""
+    if policy not in POLICIES:
+        raise ValueError(f"Неизвестная политика: {policy}")
+    new, changed, touched, removed, unchanged = diff_catalog(session, csv_path, lyrics_dir, prune)
+    stats = {"new": len(new), "changed": len(changed), "removed": len(removed),
+             "touched": len(touched), "unchanged": unchanged,
+             "added": 0, "updated": 0, "deleted": 0}
+    if dry_run:
+        return stats
+
+    # строки без состояния могут уже быть в каталоге (загружены load-catalog):
+    # один проход по (id, title, artist) вместо lower()-поиска на каждую строку
+    if new:
+        known = {}
+        for cid, t, a in (session.query(Catalog.id, Catalog.title, Catalog.artist)
+                          .execution_options(yield_per=10000)):
+            known.setdefault((t.lower().strip(), a.lower().strip()), cid)
+        for item in new:
+            item["catalog_id"] = known.get(item["key"])
+
+    work = changed + new
+    total = len(work) + len(removed) + len(touched)
+    done = 0
+    for start in range(0, len(work), batch_size):
+        batch = work[start:start + batch_size]
+        ids = [i["catalog_id"] for i in batch if i["catalog_id"]]
+        rows = {c.id: c for c in session.query(Catalog).filter(Catalog.id.in_(ids))} if ids else {}
+        fresh = []
+        for item in batch:
+            item["lyrics"] = _lyrics(item)
+            c = rows.get(item["catalog_id"])
+            if c is None:
+                c = Catalog(title=item["title"], artist=item["artist"], year=item["year"],
+                            album=item["album"], lyrics=item["lyrics"])
+                session.add(c)
+                fresh.append((item, c))
+                stats["added"] += 1
+            elif _apply_policy(c, item, policy):
+                stats["updated"] += 1
+        session.flush()
+        for item, c in fresh:
+            item["catalog_id"] = c.id
+
+        inserts = [_state_row(i) for i in batch if not i["has_state"]]
+        updates = [_state_row(i) for i in batch if i["has_state"]]
+        if inserts:
+            session.execute(insert(CatalogSyncState), inserts)
+        if updates:
+            session.execute(update(CatalogSyncState), updates)
+        session.commit()
+        session.expunge_all()
+        done += len(batch)
+        if progress:
+            progress(done, total)
+
+    for start in range(0, len(touched), batch_size):
+        batch = touched[start:start + batch_size]
+        session.execute(update(CatalogSyncState), [_state_row(i) for i in batch])
+        session.commit()
+        done += len(batch)
+
+    for start in range(0, len(removed), batch_size):
+        batch = removed[start:start + batch_size]
+        ids = [cid for _, cid in batch if cid]
+        if ids:
+            res = session.execute(delete(Catalog).where(Catalog.id.in_(ids)))
+            stats["deleted"] += res.rowcount
+            if res.rowcount:
+                bump_generation(session)       # id удалённых строк могут достаться новым
+        session.execute(delete(CatalogSyncState).where(
+            tuple_(CatalogSyncState.title_key, CatalogSyncState.artist_key).in_([k for k, _ in batch])))
+        session.commit()
+        done += len(batch)
+        if progress:
+            progress(done, total)
+    link_catalog(session)
+    return stats
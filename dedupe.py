@@ -0,0 +1,348 @@
+"""Поиск и слияние почти-дубликатов в Catalog.
+
+uq_catalog ловит только точные совпадения (title, artist). Здесь строки
+нормализуются, раскладываются по блокам (blocking keys) и сравниваются
+только внутри блока — без попарного перебора всего каталога.
+"""
+import csv
+import re
+import unicodedata
+from collections import defaultdict
+from typing import NamedTuple
+
+from sqlalchemy import bindparam, func, tuple_, update
+
+from models import Catalog, CatalogSyncState, PlaylistTrack, Track
+from artists import link_catalog, link_tracks, unlink
+from fragments import bump_generation
+from stats import rebuild as rebuild_stats
+
+
+# «шумовые» слова в скобках / после дефиса: (Remastered 2011), [Deluxe], - Radio Edit
+_NOISE = (
+    "remaster", "remastered", "deluxe", "mono", "stereo", "version", "edit",
+    "explicit", "clean", "bonus", "single", "album", "feat", "ft", "featuring",
+)
+_BRACKETS = re.compile(r"[\(\[\{]([^\)\]\}]*)[\)\]\}]")
+_DASH_SUFFIX = re.compile(r"\s+[-–—]\s+(.*)$")
+_FEAT = re.compile(r"\s+(?:feat\.?|ft\.?|featuring)\s+.*$", re.I)
+_PUNCT = re.compile(r"[^\w\s]", re.UNICODE)
+_SPACES = re.compile(r"\s+")
+
+# другая запись, а не переиздание той же: такие пометки у вариантов должны совпадать
+_RECORDING = {
+    "remix": "remix", "remixed": "remix", "mix": "remix", "rmx": "remix",
+    "live": "live", "acoustic": "acoustic", "unplugged": "acoustic",
+    "instrumental": "instrumental", "karaoke": "instrumental", "demo": "demo",
+    "reprise": "reprise", "extended": "extended", "dub": "dub", "cover": "cover",
+}
+# номер части/тома: Pt. 1 и Pt. 2 — разные песни при почти одинаковых триграммах
+_PART_WORDS = {"pt", "part", "vol", "volume", "no", "chapter", "act", "op", "movement", "mvt"}
+_ROMAN = {"ii", "iii", "iv", "v", "vi", "vii", "viii", "ix", "x", "xi", "xii",
+          "xiii", "xiv", "xv", "xvi", "xvii", "xviii", "xix", "xx"}
+
+
+class Cluster(NamedTuple):
+    keep_id: int            # строка, которая останется
+    ids: list               # все id кластера, включая keep_id
+    score: float            # минимальная похожесть, по которой склеили
+
+
+def _is_noise(fragment: str) -> bool:
+    words = _PUNCT.sub(" ", fragment.lower()).split()
+    return any(w in _NOISE for w in words)
+
+
+def _basic(s: str) -> str:
+    s = unicodedata.normalize("NFKD", s or "")
+    s = "".join(ch for ch in s if not unicodedata.combining(ch))
+    s = s.lower().replace("&", " and ")
+    s = _PUNCT.sub(" ", s)
+    return _SPACES.sub(" ", s).strip()
+
+
+def normalize_title(title: str) -> str:
+    """'Blinding Lights (Remastered 2020)' -> 'blinding lights'."""
+    t = title or ""
+    t = _BRACKETS.sub(lambda m: " " if _is_noise(m.group(1)) else m.group(0), t)
+    m = _DASH_SUFFIX.search(t)
+    if m and _is_noise(m.group(1)):
+        t = t[:m.start()]
+    t = _FEAT.sub("", t)
+    return _basic(t)
+
+
+def variant_marks(title: str, norm_title: str | None = None) -> tuple:
+    """Что отличает разные песни/записи при похожих названиях:
+    номера частей (цифры, римские, слово после Pt./Vol./No.) по нормализованному
+    названию и пометки live/remix/acoustic/... по исходному.
+    Переиздания (Remastered, Version, Edit) сюда не входят — их и сливаем."""
+    words = (norm_title if norm_title is not None else normalize_title(title)).split()
+    numbers = []
+    for i, w in enumerate(words):
+        after_part = i > 0 and words[i - 1] in _PART_WORDS
+        if w.isdigit() or w in _ROMAN or (after_part and len(w) <= 4):
+            numbers.append(w)
+    raw = _PUNCT.sub(" ", (title or "").lower()).split()
+    recording = sorted({_RECORDING[w] for w in raw if w in _RECORDING})
+    return tuple(numbers), tuple(recording)
+
+
+def normalize_artist(artist: str) -> str:
+    """'The Weeknd feat. Daft Punk' -> 'weeknd'."""
+    a = _FEAT.sub("", artist or "")
+    a = _basic(a)
+    if a.startswith("the "):
+        a = a[4:]
+    return a
+
+
+def _trigrams(s: str) -> frozenset:
+    s = f"  {s} "
+    return frozenset(s[i:i + 3] for i in range(len(s) - 2))
+
+
+def _jaccard(a: frozenset, b: frozenset) -> float:
+    if not a or not b:
+        return 0.0
+    inter = len(a & b)
+    return inter / (len(a) + len(b) - inter)
+
+
+class _UnionFind:
+    def __init__(self, n: int):
+        self.parent = list(range(n))
+
+    def find(self, x: int) -> int:
+        while self.parent[x] != x:
+            self.parent[x] = self.parent[self.parent[x]]
+            x = self.parent[x]
+        return x
+
+    def union(self, a: int, b: int):
+        ra, rb = self.find(a), self.find(b)
+        if ra != rb:
+            self.parent[max(ra, rb)] = min(ra, rb)
+
+
+def _load_rows(session, chunk: int):
+    """Только нужные колонки, потоково — лирика в память не тянется."""
+    q = (session.query(Catalog.id, Catalog.title, Catalog.artist,
+                       Catalog.year, Catalog.album,
+                       Catalog.lyrics.isnot(None).label("has_lyrics"))
+         .order_by(Catalog.id)
+         .execution_options(yield_per=chunk))
+    return [tuple(r) for r in q]
+
+
+def _completeness(row) -> tuple:
+    _id, title, _artist, year, album, has_lyrics = row
+    filled = (1 if year else 0) + (1 if (album or "").strip() else 0) + (1 if has_lyrics else 0)
+    # больше метаданных -> короче «чистое» название -> меньше id
+    return (-filled, len(title or ""), _id)
+
+
+def find_clusters(session, threshold: float = 0.85, max_block: int = 200, chunk: int = 10000):
+    """Вернуть список Cluster (только кластеры из 2+ строк) и строки каталога по id."""
+    rows = _load_rows(session, chunk)
+
+    # 1) точные совпадения после нормализации схлопываем в один ключ;
+    #    номера частей и пометки записи входят в ключ и сравниваются точно
+    key_index = {}
+    keys = []                    # (norm_artist, norm_title, variant_marks)
+    row_key = []                 # индекс ключа для каждой строки
+    for r in rows:
+        nt = normalize_title(r[1])
+        k = (normalize_artist(r[2]), nt, variant_marks(r[1], nt))
+        idx = key_index.get(k)
+        if idx is None:
+            idx = key_index[k] = len(keys)
+            keys.append(k)
+        row_key.append(idx)
+
+    uf = _UnionFind(len(keys))
+    key_score = [1.0] * len(keys)
+
+    # 2) блоки: одинаковое название -> сравниваем исполнителей,
+    #    один исполнитель + первое слово названия -> сравниваем названия
+    by_title = defaultdict(list)
+    by_artist = defaultdict(list)
+    for idx, (na, nt, _marks) in enumerate(keys):
+        if not na or not nt:
+            continue
+        by_title[nt].append(idx)
+        by_artist[(na, nt.split(" ", 1)[0])].append(idx)
+
+    grams = {}
+
+    def gram(s):
+        g = grams.get(s)
+        if g is None:
+            g = grams[s] = _trigrams(s)
+        return g
+
+    def compare(block, field):
+        if len(block) < 2 or len(block) > max_block:
+            return
+        vecs = [gram(keys[i][field]) for i in block]
+        for x in range(len(block)):
+            for y in range(x + 1, len(block)):
+                if keys[block[x]][2] != keys[block[y]][2]:
+                    continue             # Pt. 1 / Pt. 2, оригинал / Live — не дубли
+                s = _jaccard(vecs[x], vecs[y])
+                if s >= threshold:
+                    a, b = block[x], block[y]
+                    uf.union(a, b)
+                    key_score[a] = min(key_score[a], s)
+                    key_score[b] = min(key_score[b], s)
+
+    for block in by_title.values():
+        compare(block, 0)
+    for block in by_artist.values():
+        compare(block, 1)
+
+    # 3) собираем кластеры по строкам
+    groups = defaultdict(list)
+    scores = defaultdict(lambda: 1.0)
+    for i, r in enumerate(rows):
+        root = uf.find(row_key[i])
+        groups[root].append(r)
+        scores[root] = min(scores[root], key_score[row_key[i]])
+
+    by_id = {r[0]: r for r in rows}
+    clusters = []
+    for root, members in groups.items():
+        if len(members) < 2:
+            continue
+        members.sort(key=_completeness)
+        clusters.append(Cluster(
+            keep_id=members[0][0],
+            ids=[m[0] for m in members],
+            score=round(scores[root], 3),
+        ))
+    clusters.sort(key=lambda c: c.keep_id)
+    return clusters, by_id
+
+
+def write_report(clusters, by_id, path) -> None:
+    """CSV для ручной проверки: cluster, action, id, title, artist, year, album, score."""
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(["cluster", "action", "id", "title", "artist", "year", "album", "score"])
+        for n, c in enumerate(clusters, 1):
+            for cid in c.ids:
+                _id, title, artist, year, album, _ = by_id[cid]
+                w.writerow([n, "keep" if cid == c.keep_id else "merge",
+                            cid, title, artist, year or "", album or "", c.score])
+
+
+def _pair(title: str, artist: str) -> tuple:
+    return (title.lower().strip(), artist.lower().strip())
+
+
+def merge_clusters(session, clusters, batch_size: int = 500) -> dict:
+    """Слить кластеры: дозаполнить оставляемую строку, удалить дубли,
+    переименовать пользовательские Track и перенести их в плейлистах.
+    Всё — пачками, без построчной загрузки ORM-объектов треков.
+    """
+    stats = {"catalog_removed": 0, "tracks_renamed": 0, "tracks_removed": 0}
+    affected_users = set()
+    repoint = (update(PlaylistTrack.__table__)
+               .where(PlaylistTrack.playlist_id == bindparam("pl"),
+                      PlaylistTrack.track_id == bindparam("old"))
+               .values(track_id=bindparam("new")))
+    repoint_state = (update(CatalogSyncState.__table__)
+                     .where(CatalogSyncState.catalog_id == bindparam("old"))
+                     .values(catalog_id=bindparam("new")))
+
+    for start in range(0, len(clusters), batch_size):
+        batch = clusters[start:start + batch_size]
+        all_ids = [i for c in batch for i in c.ids]
+        cat = {c.id: c for c in session.query(Catalog).filter(Catalog.id.in_(all_ids))}
+
+        canon_by_pair = {}           # (title, artist) в нижнем регистре -> (title, artist) эталона
+        drop_ids, keep_of = [], {}
+        for c in batch:
+            keep = cat[c.keep_id]
+            for cid in c.ids:
+                row = cat[cid]
+                canon_by_pair[_pair(row.title, row.artist)] = (keep.title, keep.artist)
+                if cid == c.keep_id:
+                    continue
+                if not keep.year and row.year:
+                    keep.year = row.year
+                if not (keep.album or "").strip() and (row.album or "").strip():
+                    keep.album = row.album
+                    unlink(keep)
+                if not (keep.lyrics or "").strip() and (row.lyrics or "").strip():
+                    keep.lyrics = row.lyrics
+                drop_ids.append(cid)
+                keep_of[cid] = c.keep_id
+
+        # треки пользователей, совпадающие с любым вариантом из кластеров
+        tracks = (session.query(Track.id, Track.user_id, Track.title, Track.artist)
+                  .filter(tuple_(func.lower(Track.title), func.lower(Track.artist))
+                          .in_(list(canon_by_pair)))
+                  .all())
+        per_user = defaultdict(list)
+        for t in tracks:
+            canon = canon_by_pair.get(_pair(t.title, t.artist))
+            if canon:
+                per_user[(t.user_id, canon)].append(t)
+                affected_users.add(t.user_id)
+
+        renames, losers, moves = [], [], []
+        for (_uid, canon), owned in per_user.items():
+            owned.sort(key=lambda t: ((t.title, t.artist) != canon, t.id))
+            survivor = owned[0]
+            if (survivor.title, survivor.artist) != canon:
+                renames.append({"id": survivor.id, "title": canon[0], "artist": canon[1], "artist_id": None})
+            for t in owned[1:]:
+                losers.append(t.id)
+                moves.append((t.id, survivor.id))
+
+        if moves:
+            survivor_of = dict(moves)
+            links = (session.query(PlaylistTrack.playlist_id, PlaylistTrack.track_id)
+                     .filter(PlaylistTrack.track_id.in_(list(survivor_of) + list(set(survivor_of.values()))))
+                     .all())
+            present = {(pl, tid) for pl, tid in links}
+            params = []
+            for pl, tid in links:
+                new = survivor_of.get(tid)
+                if new is not None and (pl, new) not in present:
+                    params.append({"pl": pl, "old": tid, "new": new})
+                    present.add((pl, new))
+            if params:
+                session.execute(repoint, params)
+            (session.query(PlaylistTrack)
+             .filter(PlaylistTrack.track_id.in_(losers))
+             .delete(synchronize_session=False))
+            session.query(Track).filter(Track.id.in_(losers)).delete(synchronize_session=False)
+
+        if renames:
+            session.execute(update(Track), renames)
+
+        session.flush()
+        if drop_ids:
+            # sync-catalog должен видеть строки CSV удалённых дублей у оставленной строки
+            session.execute(repoint_state, [{"old": cid, "new": keep_of[cid]} for cid in drop_ids])
+            session.query(Catalog).filter(Catalog.id.in_(drop_ids)).delete(synchronize_session=False)
+        session.commit()
+
+        stats["catalog_removed"] += len(drop_ids)
+        stats["tracks_renamed"] += len(renames)
+        stats["tracks_removed"] += len(losers)
+
+    if stats["catalog_removed"] or stats["tracks_renamed"] or stats["tracks_removed"]:
+        # массовые UPDATE/DELETE обходят хуки кэша фрагментов
+        bump_generation(session)
+        session.commit()
+
+    # переименования и удаления сдвигают счётчики по артистам/декадам —
+    # агрегаты затронутых пользователей проще пересчитать целиком
+    if affected_users:
+        rebuild_stats(session, affected_users)
+    link_catalog(session)
+    link_tracks(session)
+    return stats
@@ -0,0 +1,183 @@
+"""Кэш отрендеренных фрагментов строк/модалок треков.
+
+Ключ фрагмента строится из того, от чего зависит его HTML: id и полей
+трека, id, версии и связей строки каталога (Catalog.version растёт при
+каждом UPDATE через ORM, artist_id/album_id проставляет link_catalog()).
+Поэтому изменения из других процессов (воркер, CLI) просто дают новый ключ; хуки на Track/Catalog в этом процессе сразу выкидывают
+устаревшие записи, чтобы они не занимали место до вытеснения по LRU.
+Массовые правки в обход ORM (restore-catalog, dedupe-catalog, удаления
+sync-catalog) могут вернуть прежние (id, version) с другим содержимым —
+они увеличивают поколение каталога в БД, и каждый процесс, заметив новое
+поколение, очищает свой кэш целиком.
+Кэш свой у каждого процесса веб-сервера и ограничен и числом записей, и
+объёмом: модалки с текстами песен весят десятки килобайт.
+"""
+import os
+import sys
+import threading
+from collections import OrderedDict, defaultdict
+
+from markupsafe import Markup
+from sqlalchemy import event, insert, select, update
+
+from models import Catalog, CatalogGeneration, Track
+
+MAX_ENTRIES = int(os.getenv("FRAGMENT_CACHE_SIZE", "20000"))
+MAX_BYTES = int(os.getenv("FRAGMENT_CACHE_BYTES", str(64 * 1024 * 1024)))
+
+
+class FragmentCache:
+    """LRU-словарь фрагментов с тегами для инвалидации и счётчиками попаданий."""
+
+    def __init__(self, max_entries: int = MAX_ENTRIES, max_bytes: int = MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.generation = None                 # поколение каталога, под которое наполнен кэш
+        self._data = OrderedDict()             # key -> (html, tags, size)
+        self._by_tag = defaultdict(set)        # tag -> {key}
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    def __contains__(self, key) -> bool:
+        return key in self._data
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, html, tags=()) -> None:
+        size = sys.getsizeof(html)             # фактический размер строки в памяти
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+            if size > self.max_bytes:
+                return
+            self._data[key] = (html, tuple(tags), size)
+            self.bytes += size
+            for tag in tags:
+                self._by_tag[tag].add(key)
+            while len(self._data) > self.max_entries or self.bytes > self.max_bytes:
+                self._drop(next(iter(self._data)))
+                self.evictions += 1
+
+    def _drop(self, key) -> None:
+        _html, tags, size = self._data.pop(key)
+        self.bytes -= size
+        for tag in tags:
+            keys = self._by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_tag[tag]
+
+    def invalidate(self, tag) -> int:
+        with self._lock:
+            keys = self._by_tag.pop(tag, ())
+            for key in list(keys):
+                if key in self._data:
+                    self._drop(key)
+            self.invalidations += len(keys)
+            return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._by_tag.clear()
+            self.bytes = 0
+
+    def set_generation(self, generation: int) -> bool:
+        """Запомнить поколение каталога; при смене — очистить кэш. True, если очищен."""
+        if generation == self.generation:
+            return False
+        self.clear()
+        self.generation = generation
+        return True
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._data), "max_entries": self.max_entries,
+            "bytes": self.bytes, "max_bytes": self.max_bytes, "generation": self.generation,
+            "hits": self.hits, "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else None,
+            "evictions": self.evictions, "invalidations": self.invalidations,
+        }
+
+
+cache = FragmentCache()
+
+
+def fragment_key(name: str, track, catalog=None, scope=None) -> tuple:
+    """Ключ: (фрагмент, контекст, трек, его поля, строка каталога, её версия и связи).
+    artist_id/album_id каталога проставляет link_catalog() без смены версии."""
+    return (name, scope, track.id, track.title, track.artist, track.artist_id,
+            catalog.id if catalog is not None else None,
+            catalog.version if catalog is not None else None,
+            catalog.artist_id if catalog is not None else None,
+            catalog.album_id if catalog is not None else None)
+
+
+def track_fragment(name: str, track, render, *args, catalog=None, scope=None) -> Markup:
+    """Взять фрагмент из кэша или отрендерить render(*args) и запомнить.
+    Вызывается из шаблонов (зарегистрирована как глобальная функция Jinja)."""
+    key = fragment_key(name, track, catalog, scope)
+    html = cache.get(key)
+    if html is None:
+        html = Markup(str(render(*args)))
+        tags = [("track", track.id)]
+        if catalog is not None:
+            tags.append(("catalog", catalog.id))
+        cache.put(key, html, tags)
+    return html
+
+
+def uncached(name: str, tracks, details: dict, scope=None) -> list:
+    """id строк каталога, чьих фрагментов `name` ещё нет в кэше (им нужен текст песни)."""
+    ids = []
+    for t in tracks:
+        c = details.get(t.id)
+        if c is not None and fragment_key(name, t, c, scope) not in cache:
+            ids.append(c.id)
+    return ids
+
+
+# --- Поколение каталога: сброс кэша во всех процессах ---
+
+def check_generation(session) -> None:
+    """Сверить поколение каталога в БД с кэшем (один SELECT по первичному ключу)."""
+    generation = session.execute(
+        select(CatalogGeneration.generation).where(CatalogGeneration.id == 1)
+    ).scalar()
+    cache.set_generation(generation or 0)
+
+
+def bump_generation(conn) -> None:
+    """Увеличить поколение каталога в транзакции conn (Session или Connection)
+    после правок, которые обходят хуки ниже; кэш этого процесса очищается сразу."""
+    table = CatalogGeneration.__table__
+    res = conn.execute(update(table).where(table.c.id == 1)
+                       .values(generation=table.c.generation + 1))
+    if res.rowcount == 0:
+        conn.execute(insert(table).values(id=1, generation=1))
+    cache.clear()
+
+
+# --- Инвалидация при изменениях в этом процессе ---
+
+@event.listens_for(Track, "after_update")
+@event.listens_for(Track, "after_delete")
+def _track_changed(mapper, connection, target):
+    cache.invalidate(("track", target.id))
+
+
+@event.listens_for(Catalog, "after_update")
+@event.listens_for(Catalog, "after_delete")
+def _catalog_changed(mapper, connection, target):
+    cache.invalidate(("catalog", target.id))
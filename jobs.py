@@ -0,0 +1,316 @@
+"""Лёгкая очередь фоновых задач поверх таблицы jobs — без внешнего брокера.
+
+Постановка: enqueue(session, kind, payload). Выполнение: `flask worker`.
+Родительский процесс забирает задачи из таблицы (Postgres —
+SELECT ... FOR UPDATE SKIP LOCKED, SQLite — условный UPDATE) и отдаёт их
+пулу процессов; обработчик пишет прогресс отдельным коротким коммитом.
+"""
+import multiprocessing
+import os
+import signal
+import socket
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+from pathlib import Path
+
+from sqlalchemy import update
+
+from models import Job, utcnow
+
+HANDLERS = {}
+
+RETRY_BASE = 30            # сек; задержка ретрая растёт как 30, 60, 120...
+STALE_AFTER = 300          # сек без heartbeat — воркер умер, задачу можно отдать снова
+
+
+def handler(kind: str):
+    """Зарегистрировать обработчик задачи: fn(ctx, **payload) -> dict | None."""
+    def deco(fn):
+        HANDLERS[kind] = fn
+        return fn
+    return deco
+
+
+def enqueue(session, kind: str, payload: dict | None = None, user_id: int | None = None,
+            max_attempts: int = 3) -> Job:
+    job = Job(kind=kind, payload=payload or {}, user_id=user_id, max_attempts=max_attempts)
+    session.add(job)
+    session.commit()
+    return job
+
+
+def claim(session, worker_id: str) -> int | None:
+    """Забрать одну готовую к запуску задачу и пометить её running."""
+    now = utcnow()
+    q = (session.query(Job.id)
+         .filter(Job.status == "queued", Job.run_at <= now)
+         .order_by(Job.run_at.asc(), Job.id.asc())
+         .limit(1))
+    if session.get_bind().dialect.name == "postgresql":
+        q = q.with_for_update(skip_locked=True)
+    # в SQLite блокировок строк нет: страхуемся условием status='queued' в UPDATE
+    for _ in range(5):
+        job_id = q.scalar()
+        if job_id is None:
+            session.rollback()
+            return None
+        res = session.execute(
+            update(Job)
+            .where(Job.id == job_id, Job.status == "queued")
+            .values(status="running", locked_by=worker_id, attempts=Job.attempts + 1,
+                    heartbeat_at=now, progress=0, message=None)
+            .execution_options(synchronize_session=False)
+        )
+        session.commit()
+        if res.rowcount == 1:
+            return job_id
+    return None
+
+
+def heartbeat(session, job_ids) -> None:
+    if not job_ids:
+        return
+    session.execute(update(Job).where(Job.id.in_(list(job_ids)))
+                    .values(heartbeat_at=utcnow())
+                    .execution_options(synchronize_session=False))
+    session.commit()
+
+
+def requeue_stale(session, older_than: int = STALE_AFTER) -> int:
+    """Вернуть в очередь задачи, чей воркер перестал подавать признаки жизни.
+    Исчерпавшие попытки помечаются failed, как в fail(): задача, которая
+    раз за разом убивает свой процесс, не должна крутиться вечно."""
+    now = utcnow()
+    stale = (Job.status == "running", Job.heartbeat_at < now - timedelta(seconds=older_than))
+    session.execute(
+        update(Job)
+        .where(*stale, Job.attempts >= Job.max_attempts)
+        .values(status="failed", locked_by=None, finished_at=now,
+                error="Воркер перестал отвечать во время выполнения")
+        .execution_options(synchronize_session=False)
+    )
+    res = session.execute(
+        update(Job)
+        .where(*stale)
+        .values(status="queued", locked_by=None)
+        .execution_options(synchronize_session=False)
+    )
+    session.commit()
+    return res.rowcount
+
+
+def requeue(session, job_id: int) -> None:
+    """Вернуть забранную, но так и не запущенную задачу (попытка не засчитывается)."""
+    session.execute(
+        update(Job)
+        .where(Job.id == job_id, Job.status == "running")
+        .values(status="queued", locked_by=None, attempts=Job.attempts - 1)
+        .execution_options(synchronize_session=False)
+    )
+    session.commit()
+
+
+def fail(session, job_id: int, error: str) -> str:
+    """Зафиксировать ошибку: ретрай с задержкой или окончательный failed."""
+    job = session.get(Job, job_id)
+    if job is None:
+        return "missing"
+    job.error = error[-4000:]
+    job.locked_by = None
+    if job.attempts < job.max_attempts:
+        job.status = "queued"
+        job.run_at = utcnow() + timedelta(seconds=RETRY_BASE * 2 ** max(job.attempts - 1, 0))
+    else:
+        job.status = "failed"
+        job.finished_at = utcnow()
+    session.commit()
+    return job.status
+
+
+class JobContext:
+    """То, что получает обработчик: сессию и способ сообщить о прогрессе."""
+
+    def __init__(self, session, engine, job_id: int):
+        self.session = session
+        self.engine = engine
+        self.job_id = job_id
+
+    def progress(self, percent: int, message: str | None = None) -> None:
+        # отдельное соединение: не коммитим незавершённую работу обработчика
+        values = {"progress": max(0, min(int(percent), 100)), "heartbeat_at": utcnow()}
+        if message is not None:
+            values["message"] = message[:255]
+        with self.engine.begin() as conn:
+            conn.execute(update(Job.__table__).where(Job.__table__.c.id == self.job_id).values(**values))
+
+
+def execute(session, engine, job_id: int) -> str:
+    """Выполнить задачу в текущем процессе и записать результат."""
+    job = session.get(Job, job_id)
+    if job is None or job.status != "running":
+        return "skipped"
+    fn = HANDLERS.get(job.kind)
+    payload = dict(job.payload or {})
+    try:
+        if fn is None:
+            raise LookupError(f"Неизвестный тип задачи: {job.kind}")
+        result = fn(JobContext(session, engine, job_id), **payload)
+    except Exception:
+        session.rollback()
+        return fail(session, job_id, traceback.format_exc())
+
+    job = session.get(Job, job_id)
+    job.status = "done"
+    job.progress = 100
+    job.result = result
+    job.error = None
+    job.locked_by = None
+    job.finished_at = utcnow()
+    session.commit()
+    return job.status
+
+
+def _ignore_sigint() -> None:
+    # Ctrl+C в терминале получает вся группа процессов: останавливается только родитель,
+    # а запущенные задачи дорабатывают
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _run_in_child(job_id: int) -> str:
+    # процесс пула запущен через spawn: поднимаем приложение заново
+    from app import app
+    from models import db
+    with app.app_context():
+        return execute(db.session, db.engine, job_id)
+
+
+def run_worker(session, processes: int = 2, poll: float = 1.0, once: bool = False, log=print) -> None:
+    """Главный цикл `flask worker`."""
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    requeue_stale(session)
+    running = {}
+    last_beat = time.monotonic()
+    ctx = multiprocessing.get_context("spawn")
+    pool = ProcessPoolExecutor(max_workers=processes, mp_context=ctx, initializer=_ignore_sigint)
+    log(f"Воркер {worker_id}: процессов {processes}")
+
+    def reap(futures) -> bool:
+        """Записать результаты завершившихся задач; True, если пул сломан."""
+        broken = False
+        for fut in futures:
+            job_id = running.pop(fut)
+            try:
+                status = fut.result()
+            except BrokenProcessPool as exc:         # процесс пула убит (OOM, сигнал, segfault)
+                broken = True
+                status = fail(session, job_id, f"{type(exc).__name__}: {exc}")
+            except Exception as exc:
+                status = fail(session, job_id, f"{type(exc).__name__}: {exc}")
+            log(f"← задача #{job_id}: {status}")
+        return broken
+
+    def restart(pool):
+        # задачи сломанного пула уже не выполнятся: дожидаемся их ошибок и поднимаем новый пул
+        reap(wait(list(running))[0])
+        pool.shutdown(wait=False, cancel_futures=True)
+        log("Пул процессов пересоздан")
+        return ProcessPoolExecutor(max_workers=processes, mp_context=ctx, initializer=_ignore_sigint)
+
+    try:
+        while True:
+            while len(running) < processes:
+                job_id = claim(session, worker_id)
+                if job_id is None:
+                    break
+                try:
+                    fut = pool.submit(_run_in_child, job_id)
+                except BrokenProcessPool:
+                    requeue(session, job_id)
+                    pool = restart(pool)
+                    continue
+                log(f"→ задача #{job_id}")
+                running[fut] = job_id
+
+            if not running:
+                if once:
+                    break
+                time.sleep(poll)
+                if time.monotonic() - last_beat > STALE_AFTER / 5:
+                    requeue_stale(session)
+                    last_beat = time.monotonic()
+                continue
+
+            done, _ = wait(list(running), timeout=poll, return_when=FIRST_COMPLETED)
+            if reap(done):
+                pool = restart(pool)
+
+            if time.monotonic() - last_beat > STALE_AFTER / 5:
+                heartbeat(session, running.values())
+                requeue_stale(session)
+                last_beat = time.monotonic()
+    except KeyboardInterrupt:
+        log("Остановка воркера…")
+    finally:
+        # в очередь возвращаем только задачи, которые так и не начались; запущенные
+        # дожидаемся с heartbeat, а после повторного Ctrl+C их подберёт requeue_stale
+        for fut, job_id in list(running.items()):
+            if fut.cancel():
+                running.pop(fut)
+                requeue(session, job_id)
+        pool.shutdown(wait=False, cancel_futures=True)
+        if running:
+            log(f"Ждём завершения задач: {len(running)} (повторный Ctrl+C — не ждать)")
+        try:
+            while running:
+                done, _ = wait(list(running), timeout=poll, return_when=FIRST_COMPLETED)
+                reap(done)
+                if time.monotonic() - last_beat > STALE_AFTER / 5:
+                    heartbeat(session, running.values())
+                    last_beat = time.monotonic()
+        except KeyboardInterrupt:
+            log(f"Оставлены requeue_stale: {', '.join(f'#{j}' for j in running.values())}")
+
+
+# --- Обработчики ---
+
+@handler("import-catalog")
+def import_catalog_job(ctx, csv_path: str, remove_after: bool = False, previews_dir: str | None = None):
+    """Импорт CSV каталога; загруженный через веб файл удаляется после успеха."""
+    from catalog_import import PREVIEWS_DIR, import_catalog
+
+    def progress(done, total):
+        ctx.progress(done * 100 // max(total, 1), f"Строк: {done} из {total}")
+
+    stats = import_catalog(ctx.session, csv_path, progress=progress,
+                           previews_dir=previews_dir or PREVIEWS_DIR)
+    if remove_after:
+        Path(csv_path).unlink(missing_ok=True)
+    return stats
+
+
+@handler("sync-catalog")
+def sync_catalog_job(ctx, csv_path: str, policy: str = "fill", prune: bool = True):
+    """Инкрементальная синхронизация каталога (например, ночная)."""
+    from catalog_sync import sync_catalog
+
+    def progress(done, total):
+        ctx.progress(done * 100 // max(total, 1), f"Применено: {done} из {total}")
+
+    return sync_catalog(ctx.session, csv_path, policy=policy, prune=prune, progress=progress)
+
+
+@handler("rebalance-playlist")
+def rebalance_playlist_job(ctx, playlist_id: int):
+    """Перенумерация ключей плейлиста, чьи rank стали слишком длинными."""
+    from ordering import rebalance_playlist
+    return {"tracks": rebalance_playlist(ctx.session, playlist_id)}
+
+
+@handler("rebuild-stats")
+def rebuild_stats_job(ctx, user_ids: list | None = None):
+    """Пересчёт агрегатов статистики (например, после sync-catalog)."""
+    from stats import rebuild
+    return {"users": rebuild(ctx.session, user_ids)}
@@ -0,0 +1,36 @@
+"""tracks candidate indexes
+
+Revision ID: 5b8e0c4d1f2a
+Revises: c3f1d2a9b7e4
+Create Date: 2026-10-19 11:02:17.504913
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b8e0c4d1f2a'
+down_revision = 'c3f1d2a9b7e4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('tracks', schema=None) as batch_op:
+        batch_op.create_index('ix_tracks_user_artist_title', ['user_id', 'artist', 'title', 'id'], unique=False)
+
+    # поиск подстрокой lower(col) LIKE '%q%' — только в Postgres через pg_trgm
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        op.execute('CREATE INDEX ix_tracks_title_trgm ON tracks USING gin (lower(title) gin_trgm_ops)')
+        op.execute('CREATE INDEX ix_tracks_artist_trgm ON tracks USING gin (lower(artist) gin_trgm_ops)')
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('DROP INDEX IF EXISTS ix_tracks_artist_trgm')
+        op.execute('DROP INDEX IF EXISTS ix_tracks_title_trgm')
+
+    with op.batch_alter_table('tracks', schema=None) as batch_op:
+        batch_op.drop_index('ix_tracks_user_artist_title')
@@ -0,0 +1,68 @@
+"""playlist_tracks rank
+
+Revision ID: c3f1d2a9b7e4
+Revises: 81e4a232ffa3
+Create Date: 2026-10-19 10:12:41.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3f1d2a9b7e4'
+down_revision = '81e4a232ffa3'
+branch_labels = None
+depends_on = None
+
+ALPHABET = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+
+def _spread(count, width=6):
+    # равномерные base36-ключи, как ordering.spread (копия, чтобы миграция не зависела от кода приложения)
+    base = len(ALPHABET)
+    while base ** width // (count + 1) < 2:
+        width += 1
+    step = base ** width // (count + 1)
+    keys = []
+    for i in range(count):
+        n, out = step * (i + 1), []
+        for _ in range(width):
+            n, d = divmod(n, base)
+            out.append(ALPHABET[d])
+        keys.append("".join(reversed(out)).rstrip("0"))
+    return keys
+
+
+def upgrade():
+    with op.batch_alter_table('playlist_tracks', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('rank', sa.String(length=64), nullable=True))
+
+    # прежний порядок показа: исполнитель, название
+    bind = op.get_bind()
+    rows = bind.execute(sa.text(
+        "SELECT pt.playlist_id, pt.track_id FROM playlist_tracks pt "
+        "JOIN tracks t ON t.id = pt.track_id "
+        "ORDER BY pt.playlist_id, t.artist, t.title"
+    )).fetchall()
+    by_pl = {}
+    for pl_id, track_id in rows:
+        by_pl.setdefault(pl_id, []).append(track_id)
+    params = []
+    for pl_id, track_ids in by_pl.items():
+        for track_id, key in zip(track_ids, _spread(len(track_ids))):
+            params.append({"pl": pl_id, "tr": track_id, "rank": key})
+    if params:
+        bind.execute(sa.text(
+            "UPDATE playlist_tracks SET rank = :rank WHERE playlist_id = :pl AND track_id = :tr"
+        ), params)
+
+    with op.batch_alter_table('playlist_tracks', schema=None) as batch_op:
+        batch_op.alter_column('rank', existing_type=sa.String(length=64), nullable=False)
+        batch_op.create_index('ix_playlist_tracks_playlist_rank', ['playlist_id', 'rank'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('playlist_tracks', schema=None) as batch_op:
+        batch_op.drop_index('ix_playlist_tracks_playlist_rank')
+        batch_op.drop_column('rank')
@@ -1,12 +1,28 @@
+from datetime import datetime, timezone
+
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 
-from sqlalchemy import func
+import sqlite3
+
+from sqlalchemy import event, func
+from sqlalchemy.engine import Engine
 
 db = SQLAlchemy()
 
 
+def utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+@event.listens_for(Engine, "connect")
+def _sqlite_foreign_keys(dbapi_connection, connection_record):
+    # SQLite (локальные прогоны) по умолчанию не выполняет ON DELETE CASCADE
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        dbapi_connection.execute("PRAGMA foreign_keys=ON")
+
+
 class User(UserMixin, db.Model):
     __tablename__ = "users"
 
@@ -14,7 +30,8 @@ class User(UserMixin, db.Model):
     email = db.Column(db.String(255), unique=True, nullable=False, index=True)
     password_hash = db.Column(db.String(255), nullable=False)
 
-    tracks = db.relationship("Track", backref="owner", cascade="all, delete-orphan")
+    # удаление дочерних строк делает сама БД (ON DELETE CASCADE), ORM их не загружает
+    tracks = db.relationship("Track", backref="owner", cascade="all, delete-orphan", passive_deletes=True)
 
     def set_password(self, password: str):
         self.password_hash = generate_password_hash(password)
@@ -30,13 +47,54 @@ class Track(db.Model):
     title = db.Column(db.String(255), nullable=False)
     artist = db.Column(db.String(255), nullable=False, index=True)
 
-    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    # нормализованный исполнитель (см. artists.py); строка artist остаётся как написал пользователь
+    artist_id = db.Column(db.Integer, db.ForeignKey("artists.id", ondelete="SET NULL"), nullable=True)
+    # декада, под которой трек учтён в user_decade_stats (см. stats.py)
+    stats_decade = db.Column(db.SmallInteger, nullable=False, default=0, server_default="0")
 
     __table_args__ = (
         db.UniqueConstraint("title", "artist", "user_id", name="uq_user_track"),
+        # постраничный выбор треков пользователя в порядке исполнитель/название;
+        # для поиска подстрокой в Postgres есть trigram-индексы (см. миграцию)
+        db.Index("ix_tracks_user_artist_title", "user_id", "artist", "title", "id"),
+        # фильтр /songs по artist_id и группировка по исполнителям
+        db.Index("ix_tracks_user_artist_id", "user_id", "artist_id", "title", "id"),
     )
 
 
+class Artist(db.Model):
+    __tablename__ = "artists"
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(255), nullable=False)
+    name_key = db.Column(db.String(255), nullable=False, unique=True)   # name.strip().lower()
+
+    def __repr__(self):
+        return f"<Artist {self.id}:{self.name!r}>"
+
+
+class Album(db.Model):
+    __tablename__ = "albums"
+
+    id = db.Column(db.Integer, primary_key=True)
+    artist_id = db.Column(db.Integer, db.ForeignKey("artists.id", ondelete="CASCADE"), nullable=False)
+    title = db.Column(db.String(255), nullable=False)
+    title_key = db.Column(db.String(255), nullable=False)
+    year = db.Column(db.Integer)
+
+    artist = db.relationship("Artist")
+
+    __table_args__ = (
+        db.UniqueConstraint("artist_id", "title_key", name="uq_album_artist_title"),
+        # дискография исполнителя по годам без обращения к таблице
+        db.Index("ix_albums_artist_year", "artist_id", "year", "title", "id"),
+    )
+
+    def __repr__(self):
+        return f"<Album {self.id}:{self.title!r}>"
+
+
 class Catalog(db.Model):
     __tablename__ = "catalog"
 
@@ -47,8 +105,51 @@ class Catalog(db.Model):
     year = db.Column(db.Integer)              # год выпуска
     album = db.Column(db.String(255))         # альбом
     lyrics = db.Column(db.Text)               # текст песни
+    preview_path = db.Column(db.String(512))  # аудио-превью, путь внутри PREVIEWS_DIR
+    # растёт при каждом UPDATE через ORM — входит в ключ кэша фрагментов (fragments.py)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default="1")
+    # заполняются artists.link_catalog() по строкам artist/album
+    artist_id = db.Column(db.Integer, db.ForeignKey("artists.id", ondelete="SET NULL"), nullable=True)
+    album_id = db.Column(db.Integer, db.ForeignKey("albums.id", ondelete="SET NULL"), nullable=True)
+
+    __table_args__ = (
+        db.UniqueConstraint("title", "artist", name="uq_catalog"),
+        # страница исполнителя/альбома: треки по целочисленному ключу, покрывающий индекс
+        db.Index("ix_catalog_artist_album", "artist_id", "album_id", "year", "title", "id"),
+        db.Index("ix_catalog_album_title", "album_id", "title", "id"),
+    )
+
+
+@event.listens_for(Catalog, "before_update")
+def _bump_catalog_version(mapper, connection, target):
+    # before_update зовётся и для «грязных» объектов без реальных изменений
+    if db.inspect(target).session.is_modified(target, include_collections=False):
+        target.version = (target.version or 0) + 1
+
+
+
+class CatalogGeneration(db.Model):
+    """Одна строка: поколение каталога для кэша фрагментов (см. fragments.py).
+    Растёт при массовых правках в обход ORM — restore, dedupe, удаления sync."""
+    __tablename__ = "catalog_generation"
+
+    id = db.Column(db.Integer, primary_key=True)
+    generation = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+
 
-    __table_args__ = (db.UniqueConstraint("title", "artist", name="uq_catalog"),)
+class CatalogSyncState(db.Model):
+    """Что было применено последним sync-catalog для строки CSV (см. catalog_sync.py)."""
+    __tablename__ = "catalog_sync_state"
+
+    title_key = db.Column(db.String(255), primary_key=True)     # lower(title)
+    artist_key = db.Column(db.String(255), primary_key=True)    # lower(artist)
+    catalog_id = db.Column(db.Integer, db.ForeignKey("catalog.id", ondelete="SET NULL"), index=True)
+    row_hash = db.Column(db.String(40), nullable=False)         # sha1 полей строки CSV
+    lyrics_path = db.Column(db.String(512))
+    lyrics_mtime = db.Column(db.Float)
+    lyrics_size = db.Column(db.Integer)
+    lyrics_hash = db.Column(db.String(40))
+    synced_at = db.Column(db.DateTime, nullable=False, default=utcnow)
 
                          
 def seed_catalog(db_session):
@@ -76,13 +177,14 @@ def seed_catalog(db_session):
 class Playlist(db.Model):
     __tablename__ = "playlists"
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
     title = db.Column(db.String(255), nullable=False)
     description = db.Column(db.Text, nullable=True)
     cover = db.Column(db.String(512), nullable=True)  # относительный путь внутри /static, например: uploads/playlists/xxx.jpg
     created_at = db.Column(db.DateTime, server_default=func.now(), nullable=False)
 
-    owner = db.relationship("User", backref=db.backref("playlists", cascade="all, delete-orphan", lazy="dynamic"))
+    owner = db.relationship("User", backref=db.backref("playlists", cascade="all, delete-orphan",
+                                                       lazy="dynamic", passive_deletes=True))
 
     def __repr__(self):
         return f"<Playlist {self.id}:{self.title!r}>"
@@ -93,9 +195,98 @@ class PlaylistTrack(db.Model):
     playlist_id = db.Column(db.Integer, db.ForeignKey("playlists.id", ondelete="CASCADE"), primary_key=True)
     track_id = db.Column(db.Integer, db.ForeignKey("tracks.id", ondelete="CASCADE"), primary_key=True)
     added_at = db.Column(db.DateTime, server_default=func.now(), nullable=False)
+    rank = db.Column(db.String(64), nullable=False)  # дробный ключ порядка, см. ordering.py
 
-    playlist = db.relationship("Playlist", backref=db.backref("items", cascade="all, delete-orphan", lazy="dynamic"))
+    playlist = db.relationship("Playlist", backref=db.backref("items", cascade="all, delete-orphan",
+                                                              lazy="dynamic", passive_deletes=True))
     track = db.relationship("Track")
 
+    __table_args__ = (
+        db.Index("ix_playlist_tracks_playlist_rank", "playlist_id", "rank"),
+        # каскад при удалении трека ищет ссылки по track_id — без индекса это seq scan на каждую строку
+        db.Index("ix_playlist_tracks_track_id", "track_id"),
+    )
+
     def __repr__(self):
         return f"<PlaylistTrack pl={self.playlist_id} track={self.track_id}>"
+
+
+class Job(db.Model):
+    """Фоновая задача. Очередь — сама таблица, см. jobs.py и `flask worker`."""
+    __tablename__ = "jobs"
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(64), nullable=False)
+    payload = db.Column(db.JSON, nullable=False, default=dict)
+    status = db.Column(db.String(16), nullable=False, default="queued")  # queued/running/done/failed
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id", ondelete="CASCADE"), nullable=True, index=True)
+
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    progress = db.Column(db.Integer, nullable=False, default=0)       # 0..100
+    message = db.Column(db.String(255))
+    result = db.Column(db.JSON)
+    error = db.Column(db.Text)
+
+    locked_by = db.Column(db.String(64))
+    created_at = db.Column(db.DateTime, nullable=False, default=utcnow)
+    run_at = db.Column(db.DateTime, nullable=False, default=utcnow)   # не раньше (ретраи с задержкой)
+    heartbeat_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index("ix_jobs_status_run_at", "status", "run_at"),
+    )
+
+    def to_dict(self):
+        return {
+            "id": self.id, "kind": self.kind, "status": self.status,
+            "progress": self.progress, "message": self.message,
+            "attempts": self.attempts, "max_attempts": self.max_attempts,
+            "result": self.result, "error": self.error,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+    def __repr__(self):
+        return f"<Job {self.id}:{self.kind} {self.status}>"
+
+
+# --- Агрегаты для статистики (обновляются инкрементально, см. stats.py) ---
+
+class UserStats(db.Model):
+    __tablename__ = "user_stats"
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    tracks = db.Column(db.Integer, nullable=False, default=0)
+    playlists = db.Column(db.Integer, nullable=False, default=0)
+    playlist_tracks = db.Column(db.Integer, nullable=False, default=0)
+
+
+class UserArtistStats(db.Model):
+    __tablename__ = "user_artist_stats"
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    artist_key = db.Column(db.String(255), primary_key=True)   # lower(artist)
+    artist = db.Column(db.String(255), nullable=False)          # как написано у пользователя
+    tracks = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.Index("ix_user_artist_stats_top", "user_id", "tracks"),
+    )
+
+
+class UserDecadeStats(db.Model):
+    __tablename__ = "user_decade_stats"
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    decade = db.Column(db.Integer, primary_key=True)            # 1990, 2000...; 0 — год неизвестен
+    tracks = db.Column(db.Integer, nullable=False, default=0)
+
+
+class PlaylistStats(db.Model):
+    __tablename__ = "playlist_stats"
+    playlist_id = db.Column(db.Integer, db.ForeignKey("playlists.id", ondelete="CASCADE"), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    tracks = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.Index("ix_playlist_stats_user_tracks", "user_id", "tracks"),
+    )
@@ -0,0 +1,157 @@
+"""Ручной порядок треков в плейлисте: строковые дробные ключи (rank).
+
+Ключ — дробь в base36 без ведущего «0.»: "i" = 18/36, "i8" = 18/36 + 8/36².
+Сравнение строк совпадает со сравнением чисел, поэтому ORDER BY rank даёт
+порядок, а вставка/перенос меняет ровно одну строку PlaylistTrack.
+Алфавит — только цифры и строчные латинские буквы, чтобы порядок не зависел
+от регистрозависимости collation в Postgres.
+"""
+from sqlalchemy import func, update
+
+from models import Playlist, PlaylistTrack
+
+ALPHABET = "0123456789abcdefghijklmnopqrstuvwxyz"
+BASE = len(ALPHABET)
+_INDEX = {ch: i for i, ch in enumerate(ALPHABET)}
+
+WIDTH = 6                 # точность «шага» для добавления в конец/начало
+STEP = BASE ** 2          # 36² -> ~1.6 млн добавлений в конец без удлинения ключа
+MAX_LEN = 24              # длиннее — пора перенумеровать плейлист (задачей воркера)
+HARD_LEN = 48             # rank — String(64): длиннее перенумеровываем прямо в запросе
+
+
+def _encode(n: int, width: int) -> str:
+    out = []
+    for _ in range(width):
+        n, d = divmod(n, BASE)
+        out.append(ALPHABET[d])
+    # хвостовые нули не храним: иначе между "a" и "a0" ничего не вставить
+    return "".join(reversed(out)).rstrip("0")
+
+
+def _decode(key: str, width: int) -> int:
+    key = (key or "")[:width].ljust(width, "0")
+    n = 0
+    for ch in key:
+        n = n * BASE + _INDEX[ch]
+    return n
+
+
+def rank_between(a: str | None, b: str | None) -> str:
+    """Ключ строго между a и b (None — открытая граница)."""
+    if a is not None and b is not None and a >= b:
+        raise ValueError(f"rank_between: {a!r} >= {b!r}")
+    a = a or ""
+    out = []
+    i = 0
+    while True:
+        da = _INDEX[a[i]] if i < len(a) else 0
+        db = _INDEX[b[i]] if b is not None and i < len(b) else BASE
+        if da == db:
+            out.append(ALPHABET[da])
+            i += 1
+            continue
+        mid = (da + db) // 2
+        if mid > da:
+            out.append(ALPHABET[mid])
+            return "".join(out)
+        # соседние цифры: берём da, дальше верхняя граница открыта
+        out.append(ALPHABET[da])
+        i += 1
+        b = None
+
+
+def rank_after(a: str | None) -> str:
+    """Ключ для добавления в конец — шагом, а не делением пополам."""
+    if not a:
+        return rank_between(None, None)
+    n = _decode(a, WIDTH) + STEP
+    if n < BASE ** WIDTH:
+        return _encode(n, WIDTH)
+    return rank_between(a, None)
+
+
+def rank_before(b: str | None) -> str:
+    """Ключ для вставки в начало."""
+    if not b:
+        return rank_between(None, None)
+    n = _decode(b, WIDTH) - STEP
+    if n > 0:
+        key = _encode(n, WIDTH)
+        if key < b:
+            return key
+    return rank_between(None, b)
+
+
+def spread(count: int) -> list:
+    """count равномерно распределённых коротких ключей (для перенумерации)."""
+    width = WIDTH
+    while BASE ** width // (count + 1) < 2:
+        width += 1
+    step = BASE ** width // (count + 1)
+    return [_encode(step * (i + 1), width) for i in range(count)]
+
+
+def needs_rebalance(key: str) -> bool:
+    return len(key) > MAX_LEN
+
+
+def too_long(key: str) -> bool:
+    """Ключ почти упёрся в размер колонки: воркера не ждём (его может и не быть)."""
+    return len(key) > HARD_LEN
+
+
+def lock_playlist(session, playlist_id: int) -> None:
+    """SELECT ... FOR UPDATE по строке плейлиста до конца транзакции: перенос,
+    добавление и перенумерация одного плейлиста идут по очереди и не затирают
+    ключи друг друга (в SQLite FOR UPDATE нет — там записи и так по одной)."""
+    (session.query(Playlist.id)
+     .filter(Playlist.id == playlist_id)
+     .with_for_update()
+     .scalar())
+
+
+def last_rank(session, playlist_id: int) -> str | None:
+    return (session.query(func.max(PlaylistTrack.rank))
+            .filter(PlaylistTrack.playlist_id == playlist_id)
+            .scalar())
+
+
+def rank_for_move(session, playlist_id: int, track_id: int, after_id: int | None) -> str:
+    """Новый ключ для track_id, чтобы он встал сразу после after_id
+    (None — в начало). Два индексных поиска по (playlist_id, rank)."""
+    base = (session.query(PlaylistTrack.rank)
+            .filter(PlaylistTrack.playlist_id == playlist_id,
+                    PlaylistTrack.track_id != track_id))
+    if after_id is None:
+        hi = base.order_by(PlaylistTrack.rank.asc()).limit(1).scalar()
+        return rank_before(hi)
+    lo = (session.query(PlaylistTrack.rank)
+          .filter_by(playlist_id=playlist_id, track_id=after_id)
+          .scalar())
+    if lo is None:
+        raise LookupError(after_id)
+    hi = (base.filter(PlaylistTrack.rank > lo)
+          .order_by(PlaylistTrack.rank.asc())
+          .limit(1)
+          .scalar())
+    return rank_after(lo) if hi is None else rank_between(lo, hi)
+
+
+def rebalance_playlist(session, playlist_id: int, commit: bool = True) -> int:
+    """Перенумеровать все ключи плейлиста короткими равномерными ключами.
+    commit=False — в транзакции вызывающего, блокировка плейлиста остаётся за ним."""
+    lock_playlist(session, playlist_id)
+    rows = (session.query(PlaylistTrack.track_id)
+            .filter_by(playlist_id=playlist_id)
+            .order_by(PlaylistTrack.rank.asc(), PlaylistTrack.track_id.asc())
+            .all())
+    if rows:
+        keys = spread(len(rows))
+        session.execute(update(PlaylistTrack), [
+            {"playlist_id": playlist_id, "track_id": tid, "rank": key}
+            for (tid,), key in zip(rows, keys)
+        ])
+    if commit:
+        session.commit()
+    return len(rows)
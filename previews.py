@@ -0,0 +1,110 @@
+"""Отдача аудио-превью каталога с поддержкой HTTP Range.
+
+Браузер проигрывает <audio> частями (Range: bytes=N-), поэтому каждый
+ответ — 206 с ограниченным куском файла (не больше CHUNK): воркер gunicorn
+занят недолго. Кусок читается ровно на Content-Length байт; через
+wsgi.file_wrapper (sendfile) идёт только файл целиком — не все серверы
+останавливаются на Content-Length, и тело 206 вышло бы длиннее Content-Range.
+ETag (размер и mtime файла) позволяет повторному проигрыванию не качать
+файл снова, а заменённый файл — сразу заметить.
+За nginx можно вообще не читать файл: см. PREVIEW_ACCEL_REDIRECT в app.py.
+"""
+import mimetypes
+import os
+from urllib.parse import quote
+
+from flask import Response, request
+from werkzeug.wsgi import wrap_file
+
+EXTENSIONS = (".mp3", ".ogg", ".m4a", ".opus", ".wav")
+CHUNK = 1024 * 1024                  # максимум байт в одном ответе на открытый диапазон
+# URL превью не меняется при замене файла (его подменяют в PREVIEWS_DIR без правки каталога):
+# короткий кэш, дальше браузер перепроверяет файл по ETag — 304 без тела
+MAX_AGE = 10 * 60
+
+
+def index_previews(base_dir) -> dict:
+    """{'<artist> - <title>' в нижнем регистре: имя файла} — один проход по каталогу."""
+    found = {}
+    try:
+        entries = os.scandir(base_dir)
+    except FileNotFoundError:
+        return found
+    with entries:
+        for e in entries:
+            stem, ext = os.path.splitext(e.name)
+            if ext.lower() in EXTENSIONS and e.is_file():
+                found.setdefault(stem.strip().lower(), e.name)
+    return found
+
+
+def _etag(st) -> str:
+    return f"{st.st_size:x}-{st.st_mtime_ns:x}"
+
+
+def send_preview(path: str, chunk: int = CHUNK, accel_prefix: str | None = None,
+                 rel_path: str | None = None) -> Response:
+    """Ответ на GET/HEAD превью: 200, 206, 304 или 416."""
+    st = os.stat(path)
+    size = st.st_size
+    mimetype = mimetypes.guess_type(path)[0] or "application/octet-stream"
+
+    if accel_prefix and rel_path:
+        # nginx сам обработает Range и отдаст файл через sendfile; путь — URI
+        # (кириллица в имени файла не кодируется в latin-1 заголовка)
+        rv = Response(mimetype=mimetype)
+        rv.headers["X-Accel-Redirect"] = accel_prefix.rstrip("/") + "/" + quote(rel_path)
+        return rv
+
+    rv = Response(mimetype=mimetype, direct_passthrough=True)
+    rv.set_etag(_etag(st))
+    rv.last_modified = int(st.st_mtime)
+    rv.cache_control.private = True
+    rv.cache_control.max_age = MAX_AGE
+    rv.cache_control.must_revalidate = True
+    rv.accept_ranges = "bytes"
+
+    if request.if_none_match.contains(_etag(st)) or (
+            not request.if_none_match and request.if_modified_since
+            and request.if_modified_since.timestamp() >= int(st.st_mtime)):
+        rv.status_code = 304
+        return rv
+
+    start, end = 0, size
+    rng = request.range
+    # If-Range с устаревшим ETag — отдаём файл целиком
+    if rng is not None and request.if_range.etag not in (None, _etag(st)):
+        rng = None
+    if rng is not None:
+        bounds = rng.range_for_length(size)
+        if bounds is None:
+            rv.status_code = 416
+            rv.headers["Content-Range"] = f"bytes */{size}"
+            return rv
+        start, end = bounds
+        end = min(end, start + chunk)
+        rv.status_code = 206
+        rv.content_range = f"bytes {start}-{end - 1}/{size}"
+
+    rv.content_length = end - start
+    if request.method == "HEAD" or end == start:
+        return rv
+    f = open(path, "rb")
+    if rv.status_code == 200:
+        # весь файл: file_wrapper (у gunicorn — os.sendfile) дочитает его до конца
+        rv.response = wrap_file(request.environ, f)
+    else:
+        f.seek(start)
+        rv.response = _read(f, end - start)
+    return rv
+
+
+def _read(f, remaining: int, block: int = 64 * 1024):
+    """Тело ответа на диапазон: ровно remaining байт с текущей позиции."""
+    with f:
+        while remaining > 0:
+            data = f.read(min(block, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
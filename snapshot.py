@@ -0,0 +1,182 @@
+"""Снимок каталога: быстрый dump/restore в обход ORM.
+
+Снимок — каталог с manifest.json (колонки, число строк, sha256 файла) и
+одним файлом данных:
+  catalog.csv.gz    — переносимый CSV (Postgres: COPY ... FORMAT csv,
+                      SQLite: потоковое чтение и executemany пачками);
+  catalog.pgcopy.gz — COPY ... (FORMAT binary), только Postgres -> Postgres.
+На время загрузки индексы каталога снимаются и строятся заново.
+"""
+import csv
+import gzip
+import hashlib
+import json
+from datetime import datetime, timezone
+from pathlib import Path
+
+from sqlalchemy import Integer, delete, func, insert, select, text
+
+from fragments import bump_generation
+from models import Catalog, CatalogSyncState
+
+NULL = r"\N"
+CHUNK = 10000
+FILES = {"csv": "catalog.csv.gz", "binary": "catalog.pgcopy.gz"}
+# ссылки на artists/albums в снимок не попадают: после восстановления
+# их заново проставляет artists.link_catalog()
+DERIVED = {"artist_id", "album_id"}
+
+
+def _sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with path.open("rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _columns():
+    return [c.name for c in Catalog.__table__.columns if c.name not in DERIVED]
+
+
+def dump_catalog(engine, out_dir, fmt: str = "csv") -> dict:
+    """Выгрузить catalog в out_dir, вернуть манифест."""
+    if fmt not in FILES:
+        raise ValueError(f"Неизвестный формат: {fmt}")
+    dialect = engine.dialect.name
+    if fmt == "binary" and dialect != "postgresql":
+        raise ValueError("Бинарный формат доступен только для PostgreSQL")
+
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    data_path = out_dir / FILES[fmt]
+    cols = _columns()
+    col_list = ", ".join(cols)
+
+    if dialect == "postgresql":
+        # count(*) и COPY видят один и тот же снимок данных: запись между ними
+        # не рассинхронизирует число строк в манифесте и файл
+        with engine.connect().execution_options(isolation_level="REPEATABLE READ",
+                                                postgresql_readonly=True) as conn, conn.begin():
+            rows = conn.execute(select(func.count()).select_from(Catalog.__table__)).scalar()
+            options = "FORMAT binary" if fmt == "binary" else f"FORMAT csv, HEADER, NULL '{NULL}'"
+            raw = conn.connection.dbapi_connection
+            with gzip.open(data_path, "wb", compresslevel=6) as f, raw.cursor() as cur:
+                cur.copy_expert(f"COPY catalog ({col_list}) TO STDOUT WITH ({options})", f)
+    else:
+        # считаем строки по ходу выгрузки — число в манифесте совпадает с файлом
+        rows = 0
+        with engine.connect() as conn:
+            result = conn.execution_options(stream_results=True, yield_per=CHUNK).execute(
+                select(*[Catalog.__table__.c[c] for c in cols]).order_by(Catalog.__table__.c.id))
+            with gzip.open(data_path, "wt", encoding="utf-8", newline="", compresslevel=6) as f:
+                w = csv.writer(f)
+                w.writerow(cols)
+                for part in result.partitions():
+                    w.writerows([NULL if v is None else v for v in r] for r in part)
+                    rows += len(part)
+
+    manifest = {
+        "table": "catalog",
+        "format": fmt,
+        "file": data_path.name,
+        "sha256": _sha256(data_path),
+        "bytes": data_path.stat().st_size,
+        "rows": rows,
+        "columns": cols,
+        "dialect": dialect,
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }
+    (out_dir / "manifest.json").write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+    return manifest
+
+
+def read_manifest(snap_dir) -> dict:
+    """Прочитать манифест и проверить контрольную сумму файла данных."""
+    snap_dir = Path(snap_dir)
+    manifest = json.loads((snap_dir / "manifest.json").read_text(encoding="utf-8"))
+    data_path = snap_dir / manifest["file"]
+    if not data_path.exists():
+        raise ValueError(f"Нет файла данных {data_path}")
+    if _sha256(data_path) != manifest["sha256"]:
+        raise ValueError("Контрольная сумма не совпадает: снимок повреждён")
+    unknown = set(manifest["columns"]) - set(_columns())
+    if unknown:
+        raise ValueError(f"В снимке есть колонки, которых нет в таблице: {', '.join(sorted(unknown))}")
+    return manifest
+
+
+def _drop_indexes(conn, dialect):
+    table = Catalog.__table__
+    for idx in table.indexes:
+        idx.drop(conn, checkfirst=True)
+    if dialect == "postgresql":
+        conn.execute(text("ALTER TABLE catalog DROP CONSTRAINT IF EXISTS uq_catalog"))
+
+
+def _create_indexes(conn, dialect):
+    table = Catalog.__table__
+    if dialect == "postgresql":
+        conn.execute(text("ALTER TABLE catalog ADD CONSTRAINT uq_catalog UNIQUE (title, artist)"))
+    for idx in table.indexes:
+        idx.create(conn, checkfirst=True)
+
+
+def restore_catalog(engine, snap_dir) -> dict:
+    """Заменить содержимое catalog снимком (одна транзакция)."""
+    snap_dir = Path(snap_dir)
+    manifest = read_manifest(snap_dir)
+    dialect = engine.dialect.name
+    if manifest["format"] == "binary" and dialect != "postgresql":
+        raise ValueError("Бинарный снимок восстанавливается только в PostgreSQL")
+
+    cols = manifest["columns"]
+    table = Catalog.__table__
+    data_path = snap_dir / manifest["file"]
+
+    with engine.begin() as conn:
+        # состояние sync-catalog ссылается на старые id — начнём с чистого листа
+        conn.execute(delete(CatalogSyncState.__table__))
+        _drop_indexes(conn, dialect)
+        if dialect == "postgresql":
+            conn.execute(text("TRUNCATE catalog_sync_state, catalog"))
+            options = ("FORMAT binary" if manifest["format"] == "binary"
+                       else f"FORMAT csv, HEADER, NULL '{NULL}'")
+            raw = conn.connection.dbapi_connection
+            with gzip.open(data_path, "rb") as f, raw.cursor() as cur:
+                cur.copy_expert(f"COPY catalog ({', '.join(cols)}) FROM STDIN WITH ({options})", f)
+            conn.execute(text(
+                "SELECT setval(pg_get_serial_sequence('catalog', 'id'), "
+                "COALESCE((SELECT MAX(id) FROM catalog), 0) + 1, false)"))
+        else:
+            conn.execute(delete(table))
+            ints = {c for c in cols if isinstance(table.c[c].type, Integer)}
+            stmt = insert(table)
+            with gzip.open(data_path, "rt", encoding="utf-8", newline="") as f:
+                reader = csv.reader(f)
+                next(reader, None)                      # заголовок
+                chunk = []
+                for row in reader:
+                    rec = {}
+                    for name, val in zip(cols, row):
+                        if val == NULL:
+                            val = None
+                        elif name in ints:
+                            val = int(val)
+                        rec[name] = val
+                    chunk.append(rec)
+                    if len(chunk) >= CHUNK:
+                        conn.execute(stmt, chunk)
+                        chunk = []
+                if chunk:
+                    conn.execute(stmt, chunk)
+        rows = conn.execute(select(func.count()).select_from(table)).scalar()
+        if rows != manifest["rows"]:                   # исключение откатит транзакцию
+            raise ValueError(f"Загружено {rows} строк, в манифесте {manifest['rows']}")
+        _create_indexes(conn, dialect)
+        # восстановленные строки приходят с прежними id/version — кэш фрагментов сбрасывается
+        bump_generation(conn)
+        if dialect == "postgresql":
+            conn.execute(text("ANALYZE catalog"))
+
+    return {"rows": rows, "format": manifest["format"]}
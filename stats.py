@@ -0,0 +1,209 @@
+"""Статистика библиотеки на инкрементальных агрегатах.
+
+Маршруты, которые добавляют/удаляют треки и плейлисты, вызывают функции
+отсюда в той же транзакции; счётчики меняются UPSERT'ом (+delta), поэтому
+дашборд читает готовые числа без GROUP BY по всей библиотеке.
+Декада берётся из Catalog.year на момент добавления трека и запоминается
+в Track.stats_decade: при удалении вычитается именно она, даже если год в
+каталоге с тех пор поменялся. Перераспределить треки по новым годам
+каталога — `flask rebuild-stats`.
+"""
+from collections import Counter
+
+from sqlalchemy import delete, func, insert, literal, select, true, tuple_, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from models import (Catalog, Playlist, PlaylistStats, PlaylistTrack, Track, User,
+                    UserArtistStats, UserDecadeStats, UserStats)
+
+TOP_ARTISTS = 10
+TOP_PLAYLISTS = 5
+
+
+def _bump(session, model, keys: dict, deltas: dict, extra: dict | None = None):
+    """INSERT ... ON CONFLICT DO UPDATE SET col = col + delta."""
+    table = model.__table__
+    dialect = session.get_bind().dialect.name
+    make = pg_insert if dialect == "postgresql" else sqlite_insert
+    stmt = make(table).values(**keys, **deltas, **(extra or {}))
+    stmt = stmt.on_conflict_do_update(
+        index_elements=list(keys),
+        set_={c: table.c[c] + stmt.excluded[c] for c in deltas},
+    )
+    session.execute(stmt)
+
+
+def _decades(session, tracks) -> list:
+    """Декада для каждой пары (title, artist) по Catalog.year одним запросом."""
+    pairs = [(t.lower().strip(), a.lower().strip()) for t, a in tracks]
+    years = {}
+    if pairs:
+        rows = (session.query(func.lower(Catalog.title), func.lower(Catalog.artist), Catalog.year)
+                .filter(tuple_(func.lower(Catalog.title), func.lower(Catalog.artist)).in_(pairs))
+                .filter(Catalog.year.isnot(None))
+                .all())
+        for t, a, y in rows:
+            key = (t.strip(), a.strip())
+            years[key] = max(years.get(key, y), y)
+    return [years[p] // 10 * 10 if p in years else 0 for p in pairs]
+
+
+def _tracks_delta(session, user_id: int, tracks, decades, sign: int):
+    if not tracks:
+        return
+    _bump(session, UserStats, {"user_id": user_id}, {"tracks": sign * len(tracks)})
+    artists = Counter()
+    names = {}
+    for t in tracks:
+        key = t.artist.lower().strip()
+        artists[key] += 1
+        names.setdefault(key, t.artist)
+    for key, n in artists.items():
+        _bump(session, UserArtistStats, {"user_id": user_id, "artist_key": key},
+              {"tracks": sign * n}, {"artist": names[key]})
+    for decade, n in Counter(decades).items():
+        _bump(session, UserDecadeStats, {"user_id": user_id, "decade": decade}, {"tracks": sign * n})
+    if sign < 0:
+        # опустевшие строки не держим, чтобы топ не засорялся нулями
+        session.execute(delete(UserArtistStats).where(UserArtistStats.user_id == user_id,
+                                                      UserArtistStats.tracks <= 0))
+        session.execute(delete(UserDecadeStats).where(UserDecadeStats.user_id == user_id,
+                                                      UserDecadeStats.tracks <= 0))
+
+
+def tracks_added(session, user_id: int, tracks) -> None:
+    """tracks — новые Track (ещё до flush); им проставляется stats_decade."""
+    tracks = list(tracks)
+    with session.no_autoflush:
+        decades = _decades(session, [(t.title, t.artist) for t in tracks])
+    for t, decade in zip(tracks, decades):
+        t.stats_decade = decade
+    _tracks_delta(session, user_id, tracks, decades, +1)
+
+
+def tracks_removed(session, user_id: int, tracks) -> None:
+    """tracks — удаляемые Track; вычитается декада, под которой каждый был учтён."""
+    tracks = list(tracks)
+    _tracks_delta(session, user_id, tracks, [t.stats_decade or 0 for t in tracks], -1)
+
+
+def playlist_created(session, user_id: int, playlist_id: int) -> None:
+    _bump(session, UserStats, {"user_id": user_id}, {"playlists": 1})
+    _bump(session, PlaylistStats, {"playlist_id": playlist_id}, {"tracks": 0}, {"user_id": user_id})
+
+
+def playlist_deleted(session, user_id: int, playlist_id: int) -> None:
+    size = (session.query(PlaylistStats.tracks)
+            .filter_by(playlist_id=playlist_id)
+            .scalar()) or 0
+    _bump(session, UserStats, {"user_id": user_id}, {"playlists": -1, "playlist_tracks": -size})
+    session.execute(delete(PlaylistStats).where(PlaylistStats.playlist_id == playlist_id))
+
+
+def playlist_tracks_changed(session, user_id: int, playlist_id: int, delta: int) -> None:
+    if not delta:
+        return
+    _bump(session, UserStats, {"user_id": user_id}, {"playlist_tracks": delta})
+    _bump(session, PlaylistStats, {"playlist_id": playlist_id}, {"tracks": delta}, {"user_id": user_id})
+
+
+def track_playlists_changed(session, user_id: int, track_ids, sign: int = -1) -> None:
+    """Трек(и) исчезают из всех своих плейлистов (удаление трека)."""
+    rows = (session.query(PlaylistTrack.playlist_id, func.count())
+            .filter(PlaylistTrack.track_id.in_(list(track_ids)))
+            .group_by(PlaylistTrack.playlist_id)
+            .all())
+    for playlist_id, n in rows:
+        playlist_tracks_changed(session, user_id, playlist_id, sign * n)
+
+
+def rebuild(session, user_ids=None) -> int:
+    """Пересчитать все агрегаты из исходных таблиц (бэкфилл / после массовых правок)."""
+    def scope(col):
+        return col.in_(list(user_ids)) if user_ids is not None else true()
+
+    for model in (UserStats, UserArtistStats, UserDecadeStats, PlaylistStats):
+        session.execute(delete(model).where(scope(model.user_id)))
+
+    tracks_q = (select(func.count()).where(Track.user_id == User.id).scalar_subquery())
+    playlists_q = (select(func.count()).where(Playlist.user_id == User.id).scalar_subquery())
+    items_q = (select(func.count())
+               .select_from(PlaylistTrack)
+               .join(Playlist, Playlist.id == PlaylistTrack.playlist_id)
+               .where(Playlist.user_id == User.id)
+               .scalar_subquery())
+    session.execute(insert(UserStats).from_select(
+        ["user_id", "tracks", "playlists", "playlist_tracks"],
+        select(User.id, tracks_q, playlists_q, items_q).where(scope(User.id))))
+
+    artist_key = func.lower(func.trim(Track.artist))
+    session.execute(insert(UserArtistStats).from_select(
+        ["user_id", "artist_key", "artist", "tracks"],
+        select(Track.user_id, artist_key, func.min(Track.artist), func.count())
+        .where(scope(Track.user_id))
+        .group_by(Track.user_id, artist_key)))
+
+    # треки перераспределяются по текущим годам каталога
+    year_q = (select(func.max(Catalog.year))
+              .where(func.lower(Catalog.title) == func.lower(Track.title),
+                     func.lower(Catalog.artist) == func.lower(Track.artist))
+              .scalar_subquery())
+    session.execute(update(Track)
+                    .where(scope(Track.user_id))
+                    .values(stats_decade=func.coalesce(year_q // 10 * 10, literal(0)))
+                    .execution_options(synchronize_session=False))
+    session.execute(insert(UserDecadeStats).from_select(
+        ["user_id", "decade", "tracks"],
+        select(Track.user_id, Track.stats_decade, func.count())
+        .where(scope(Track.user_id))
+        .group_by(Track.user_id, Track.stats_decade)))
+
+    session.execute(insert(PlaylistStats).from_select(
+        ["playlist_id", "user_id", "tracks"],
+        select(Playlist.id, Playlist.user_id, func.count(PlaylistTrack.track_id))
+        .select_from(Playlist)
+        .outerjoin(PlaylistTrack, PlaylistTrack.playlist_id == Playlist.id)
+        .where(scope(Playlist.user_id))
+        .group_by(Playlist.id, Playlist.user_id)))
+
+    session.commit()
+    return session.query(func.count(UserStats.user_id)).scalar()
+
+
+def summary(session, user_id: int) -> dict:
+    """Всё для дашборда: чтения по первичному ключу и top-N по индексам."""
+    totals = session.get(UserStats, user_id)
+    artists = (session.query(UserArtistStats.artist, UserArtistStats.tracks)
+               .filter(UserArtistStats.user_id == user_id, UserArtistStats.tracks > 0)
+               .order_by(UserArtistStats.tracks.desc(), UserArtistStats.artist_key.asc())
+               .limit(TOP_ARTISTS)
+               .all())
+    decades = (session.query(UserDecadeStats.decade, UserDecadeStats.tracks)
+               .filter(UserDecadeStats.user_id == user_id, UserDecadeStats.tracks > 0)
+               .order_by(UserDecadeStats.decade.asc())
+               .all())
+    playlists = (session.query(Playlist.id, Playlist.title, PlaylistStats.tracks)
+                 .join(PlaylistStats, PlaylistStats.playlist_id == Playlist.id)
+                 .filter(PlaylistStats.user_id == user_id)
+                 .order_by(PlaylistStats.tracks.desc(), Playlist.id.asc())
+                 .limit(TOP_PLAYLISTS)
+                 .all())
+    return {
+        "tracks": totals.tracks if totals else 0,
+        "playlists": totals.playlists if totals else 0,
+        "playlist_tracks": totals.playlist_tracks if totals else 0,
+        "artists": [{"artist": a, "tracks": n} for a, n in artists],
+        "decades": [{"decade": d, "tracks": n} for d, n in decades],
+        "top_playlists": [{"id": i, "title": t, "tracks": n} for i, t, n in playlists],
+    }
+
+
+def playlist_sizes(session, playlist_ids) -> dict:
+    """{playlist_id: число треков} одним запросом по первичному ключу."""
+    if not playlist_ids:
+        return {}
+    rows = (session.query(PlaylistStats.playlist_id, PlaylistStats.tracks)
+            .filter(PlaylistStats.playlist_id.in_(list(playlist_ids)))
+            .all())
+    return dict(rows)
@@ -0,0 +1,43 @@
+"""Общая обвязка тестов: приложение на временной SQLite-базе.
+
+Схема создаётся через db.create_all(); функции Postgres, которые модели
+используют в server_default (now()), подставляются в SQLite при подключении.
+"""
+import os
+import sys
+import tempfile
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pytest
+from sqlalchemy import event
+
+_tmp = Path(tempfile.mkdtemp(prefix="meloman-tests-"))
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmp / 'test.db'}"
+os.environ.setdefault("JINJA_CACHE_DIR", str(_tmp / "jinja_cache"))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app import app as flask_app  # noqa: E402
+from models import db  # noqa: E402
+
+
+@event.listens_for(db.Engine, "connect")
+def _sqlite_now(dbapi_conn, _record):
+    if hasattr(dbapi_conn, "create_function"):
+        dbapi_conn.create_function(
+            "now", 0, lambda: datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S"))
+
+
+@pytest.fixture
+def app():
+    flask_app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    with flask_app.app_context():
+        db.create_all()
+        yield flask_app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def session(app):
+    return db.session
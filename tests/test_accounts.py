@@ -0,0 +1,32 @@
+import re
+
+from models import User
+
+
+def _login(app, session):
+    user = User(email="bye@example.com")
+    user.set_password("secret12")
+    session.add(user)
+    session.commit()
+    client = app.test_client()
+    client.post("/login", data={"email": "bye@example.com", "password": "secret12"})
+    return client
+
+
+def test_account_delete_requires_csrf_and_password(app, session):
+    client = _login(app, session)
+    app.config["WTF_CSRF_ENABLED"] = True
+    try:
+        client.post("/account/delete", data={"password": "secret12"})
+        assert session.query(User).count() == 1          # без токена — подделанный POST
+
+        html = client.get("/dashboard").get_data(as_text=True)
+        token = re.search(r'name="csrf_token" type="hidden" value="([^"]+)"', html).group(1)
+        client.post("/account/delete", data={"csrf_token": token, "password": "wrong-pass"})
+        assert session.query(User).count() == 1
+
+        rv = client.post("/account/delete", data={"csrf_token": token, "password": "secret12"})
+        assert rv.status_code == 302
+        assert session.query(User).count() == 0
+    finally:
+        app.config["WTF_CSRF_ENABLED"] = False
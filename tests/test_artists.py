@@ -0,0 +1,59 @@
+from artists import link_catalog, link_tracks
+from models import Album, Artist, Catalog, Track, User
+from snapshot import dump_catalog, restore_catalog
+
+
+def _catalog(session):
+    session.add_all([
+        Catalog(title="Believer", artist="Imagine Dragons", album="Evolve", year=2017),
+        Catalog(title="Thunder", artist="imagine dragons ", album="Evolve", year=2017),
+        Catalog(title="Radioactive", artist="Imagine Dragons", album="Night Visions", year=2012),
+        Catalog(title="Single", artist="Imagine Dragons"),
+    ])
+    session.commit()
+
+
+def test_link_catalog_is_set_based_and_keeps_versions(session):
+    _catalog(session)
+    assert link_catalog(session, batch_size=2) == 4
+    assert link_catalog(session) == 0
+    rows = session.query(Catalog).order_by(Catalog.id).all()
+    assert session.query(Artist).count() == 1
+    assert {r.artist_id for r in rows} == {session.query(Artist.id).scalar()}
+    assert rows[0].album_id == rows[1].album_id != rows[2].album_id
+    assert rows[3].album_id is None
+    assert session.query(Album).count() == 2
+    assert [r.version for r in rows] == [1, 1, 1, 1]     # превью и фрагменты не сбрасываются
+
+
+def test_restore_relinks_without_version_bump(app, session, tmp_path):
+    _catalog(session)
+    link_catalog(session)
+    versions = dict(session.query(Catalog.id, Catalog.version))
+    dump_catalog(session.get_bind(), tmp_path / "snap")
+    session.remove()
+    restore_catalog(session.get_bind(), tmp_path / "snap")
+    assert session.query(Catalog).filter(Catalog.artist_id.is_(None)).count() == 4
+    assert link_catalog(session) == 4
+    assert dict(session.query(Catalog.id, Catalog.version)) == versions
+
+
+def test_songs_filter_finds_unlinked_tracks(app, session):
+    user = User(email="songs@example.com")
+    user.set_password("secret12")
+    session.add_all([user, Catalog(title="Believer", artist="Imagine Dragons")])
+    session.commit()
+    link_catalog(session)
+    artist_id = session.query(Artist.id).scalar()
+    session.add_all([Track(title="Believer", artist="Imagine Dragons", owner=user, artist_id=artist_id),
+                     Track(title="Demons", artist="Imagine Dragons", owner=user),        # ещё не связан
+                     Track(title="Yellow", artist="Coldplay", owner=user)])
+    session.commit()
+
+    client = app.test_client()
+    client.post("/login", data={"email": "songs@example.com", "password": "secret12"})
+    for query in (f"artist_id={artist_id}", "artist=dragons"):
+        html = client.get(f"/songs?{query}").get_data(as_text=True)
+        assert "Believer" in html and "Demons" in html and "Yellow" not in html
+
+    assert link_tracks(session) == 2
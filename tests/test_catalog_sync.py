@@ -0,0 +1,39 @@
+import csv
+
+from catalog_sync import sync_catalog
+from dedupe import find_clusters, merge_clusters
+from models import Catalog, CatalogSyncState
+
+
+def _write_csv(path, rows):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(["title", "artist", "year", "album", "lyrics"])
+        w.writerows(rows)
+
+
+def test_sync_after_dedupe_keeps_merged_row(session, tmp_path):
+    csv_path = tmp_path / "catalog.csv"
+    _write_csv(csv_path, [
+        ("Blinding Lights", "The Weeknd", "2019", "After Hours", ""),
+        ("Blinding Lights (Remastered 2020)", "Weeknd", "", "", ""),
+    ])
+    sync_catalog(session, csv_path, lyrics_dir=tmp_path, policy="overwrite")
+    assert session.query(Catalog).count() == 2
+
+    clusters, _ = find_clusters(session)
+    merge_clusters(session, clusters)
+    kept = session.query(Catalog).one()
+    assert kept.title == "Blinding Lights"
+    assert {s.catalog_id for s in session.query(CatalogSyncState)} == {kept.id}
+
+    # обе строки CSV изменились; вариант не должен переписать название и исполнителя
+    _write_csv(csv_path, [
+        ("Blinding Lights", "The Weeknd", "2020", "After Hours", ""),
+        ("Blinding Lights (Remastered 2020)", "Weeknd", "2021", "Hits", ""),
+    ])
+    for policy in ("overwrite", "mirror"):
+        sync_catalog(session, csv_path, lyrics_dir=tmp_path, policy=policy)
+        kept = session.query(Catalog).one()
+        assert (kept.title, kept.artist, kept.year, kept.album) == \
+            ("Blinding Lights", "The Weeknd", 2020, "After Hours")
@@ -0,0 +1,56 @@
+from dedupe import find_clusters, merge_clusters
+from models import Catalog, Track, User
+
+
+def _catalog(session, *rows):
+    for title, artist in rows:
+        session.add(Catalog(title=title, artist=artist))
+    session.commit()
+
+
+def _clustered_titles(session):
+    clusters, by_id = find_clusters(session)
+    return [sorted(by_id[i][1] for i in c.ids) for c in clusters]
+
+
+def test_numbered_parts_are_not_merged(session):
+    _catalog(session,
+             ("Another Brick in the Wall, Pt. 1", "Pink Floyd"),
+             ("Another Brick in the Wall, Pt. 2", "Pink Floyd"),
+             ("Symphony No. 5", "Beethoven"),
+             ("Symphony No. 9", "Beethoven"),
+             ("Rocky II Theme", "Bill Conti"),
+             ("Rocky III Theme", "Bill Conti"))
+    assert _clustered_titles(session) == []
+
+
+def test_live_variant_of_remaster_is_not_merged(session):
+    _catalog(session,
+             ("Money (2011 Remaster)", "Pink Floyd"),
+             ("Money (Live, 2011 Remaster)", "Pink Floyd"),
+             ("Money - Remix", "Pink Floyd"))
+    assert _clustered_titles(session) == []
+
+
+def test_remaster_of_same_recording_is_still_merged(session):
+    _catalog(session,
+             ("Blinding Lights", "The Weeknd"),
+             ("Blinding Lights (Remastered 2020)", "Weeknd"))
+    assert _clustered_titles(session) == [["Blinding Lights", "Blinding Lights (Remastered 2020)"]]
+
+
+def test_merge_keeps_users_other_part(session):
+    _catalog(session,
+             ("Another Brick in the Wall, Pt. 1", "Pink Floyd"),
+             ("Another Brick in the Wall, Pt. 2", "Pink Floyd"))
+    user = User(email="wall@example.com")
+    user.set_password("secret12")
+    session.add(user)
+    session.add(Track(title="Another Brick in the Wall, Pt. 2", artist="Pink Floyd", owner=user))
+    session.commit()
+
+    clusters, _ = find_clusters(session)
+    stats = merge_clusters(session, clusters)
+    assert stats["catalog_removed"] == 0 and stats["tracks_removed"] == 0 and stats["tracks_renamed"] == 0
+    assert session.query(Catalog).count() == 2
+    assert session.query(Track.title).scalar() == "Another Brick in the Wall, Pt. 2"
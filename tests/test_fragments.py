@@ -0,0 +1,37 @@
+from markupsafe import Markup
+
+import fragments
+from fragments import FragmentCache
+
+
+def test_cache_is_bounded_by_bytes():
+    html = Markup("x" * 10_000)
+    cache = FragmentCache(max_entries=100, max_bytes=35_000)
+    for i in range(10):
+        cache.put(("modal", i), html, [("track", i)])
+    assert cache.bytes <= 35_000
+    assert len(cache._data) == 3
+    assert ("modal", 9) in cache and ("modal", 0) not in cache
+
+    cache.invalidate(("track", 9))
+    assert ("modal", 9) not in cache
+    assert cache.bytes == sum(size for _h, _t, size in cache._data.values())
+
+
+def test_oversized_fragment_is_not_cached():
+    cache = FragmentCache(max_entries=100, max_bytes=1_000)
+    cache.put("big", Markup("x" * 5_000))
+    assert "big" not in cache and cache.bytes == 0
+
+
+def test_generation_bump_clears_cache(session):
+    fragments.check_generation(session)
+    fragments.cache.put("row", Markup("<td></td>"))
+    fragments.check_generation(session)
+    assert "row" in fragments.cache
+
+    fragments.bump_generation(session)
+    session.commit()
+    fragments.cache.put("row", Markup("<td></td>"))       # наполнено другим процессом до сверки
+    fragments.check_generation(session)
+    assert "row" not in fragments.cache
@@ -0,0 +1,71 @@
+from datetime import datetime
+
+import pytest
+
+from models import Playlist, PlaylistTrack, Track, User
+from ordering import HARD_LEN, rank_after, rank_before, rank_between, spread
+
+
+def test_rank_between_orders_keys():
+    for a, b in [(None, None), (None, "i"), ("i", None), ("a", "b"), ("a", "a01"), ("zz", "zz1")]:
+        key = rank_between(a, b)
+        assert (a is None or a < key) and (b is None or key < b)
+    with pytest.raises(ValueError):
+        rank_between("b", "a")
+
+
+def test_rank_after_and_before_are_monotonic():
+    keys = [rank_after(None)]
+    for _ in range(200):
+        keys.append(rank_after(keys[-1]))
+    assert keys == sorted(keys) and len(set(keys)) == len(keys)
+    assert max(map(len, keys)) <= 6
+
+    front = [rank_before(keys[0])]
+    for _ in range(50):
+        front.append(rank_before(front[-1]))
+    assert front == sorted(front, reverse=True) and front[-1] < keys[0]
+
+
+def test_spread_is_sorted_and_unique():
+    for n in (1, 2, 35, 1000, 50_000):
+        keys = spread(n)
+        assert len(keys) == n and keys == sorted(keys) and len(set(keys)) == n
+        assert all(k and not k.endswith("0") for k in keys)
+
+
+def test_exhausting_one_gap_grows_by_at_most_one_char():
+    lo, hi = "i", "j"
+    for _ in range(400):
+        key = rank_between(lo, hi)
+        assert lo < key < hi
+        assert len(key) <= max(len(lo), len(hi)) + 1
+        hi = key                          # всё время вставляем в один и тот же промежуток
+    assert len(hi) > 64                   # без перенумерации колонка String(64) переполнилась бы
+
+
+def test_move_into_same_gap_rebalances_in_request(app, session):
+    user = User(email="order@example.com")
+    user.set_password("secret12")
+    session.add(user)
+    tracks = [Track(title=f"t{i}", artist="x", owner=user) for i in range(3)]
+    pl = Playlist(title="p", owner=user, created_at=datetime.utcnow())
+    session.add_all([*tracks, pl])
+    session.commit()
+    a, b, c = (t.id for t in tracks)
+    session.add_all([PlaylistTrack(playlist_id=pl.id, track_id=t, rank=r)
+                     for t, r in zip((a, b, c), spread(3))])
+    session.commit()
+
+    client = app.test_client()
+    client.post("/login", data={"email": "order@example.com", "password": "secret12"})
+    for n in range(400):
+        moved = c if n % 2 == 0 else b
+        rv = client.post(f"/api/playlists/{pl.id}/move", json={"track_id": moved, "after_id": a})
+        assert rv.status_code == 200
+        assert len(rv.get_json()["rank"]) <= HARD_LEN
+    ranks = dict(session.query(PlaylistTrack.track_id, PlaylistTrack.rank).filter_by(playlist_id=pl.id))
+    assert ranks[a] < ranks[b] < ranks[c]
+
+    rv = client.post(f"/api/playlists/{pl.id}/move", json={"track_id": a, "after_id": a})
+    assert rv.status_code == 400
@@ -0,0 +1,29 @@
+from datetime import datetime
+
+import stats
+from models import Playlist, PlaylistTrack, Track, User
+
+
+def test_form_fallback_adds_every_selected_track(app, session):
+    user = User(email="form@example.com")
+    user.set_password("secret12")
+    tracks = [Track(title=f"f{i}", artist="x", owner=user) for i in range(3)]
+    pl = Playlist(title="p", owner=user, created_at=datetime.utcnow())
+    session.add_all([user, *tracks, pl])
+    session.commit()
+    stats.playlist_created(session, user.id, pl.id)
+    session.commit()
+
+    client = app.test_client()
+    client.post("/login", data={"email": "form@example.com", "password": "secret12"})
+    ids = [t.id for t in tracks]
+    rv = client.post(f"/playlists/{pl.id}/add", data={"track_id": [ids[2], ids[0]]})
+    assert rv.status_code == 302
+    order = [tid for (tid,) in session.query(PlaylistTrack.track_id)
+             .filter_by(playlist_id=pl.id).order_by(PlaylistTrack.rank)]
+    assert order == [ids[2], ids[0]]
+
+    rv = client.post(f"/api/playlists/{pl.id}/tracks", json={"track_ids": [ids[1]]})
+    assert rv.get_json()["count"] == 3
+    rv = client.delete(f"/api/playlists/{pl.id}/tracks", json={"track_ids": [ids[0], ids[1]]})
+    assert rv.get_json()["count"] == 1
@@ -0,0 +1,66 @@
+import os
+from urllib.parse import unquote
+
+from werkzeug.wsgi import FileWrapper
+
+from previews import MAX_AGE, send_preview
+
+DATA = bytes(range(256)) * 8          # 2048 байт
+
+
+def _file(tmp_path, name="Кино - Группа крови.mp3"):
+    path = tmp_path / name
+    path.write_bytes(DATA)
+    return path
+
+
+def test_accel_redirect_is_uri_encoded(app, tmp_path):
+    path = _file(tmp_path)
+    with app.test_request_context("/"):
+        rv = send_preview(str(path), accel_prefix="/_previews/", rel_path=path.name)
+    value = rv.headers["X-Accel-Redirect"]
+    value.encode("latin-1")
+    assert value.startswith("/_previews/") and " " not in value
+    assert unquote(value) == "/_previews/" + path.name
+
+
+def test_range_body_matches_content_range_with_file_wrapper(app, tmp_path):
+    path = _file(tmp_path)
+    environ = {"wsgi.file_wrapper": FileWrapper}
+    with app.test_request_context("/", headers={"Range": "bytes=100-"}, environ_base=environ):
+        rv = send_preview(str(path), chunk=500)
+        body = b"".join(rv.response)
+    assert rv.status_code == 206
+    assert rv.headers["Content-Range"] == f"bytes 100-599/{len(DATA)}"
+    assert rv.content_length == len(body) == 500
+    assert body == DATA[100:600]
+
+
+def test_full_response_uses_file_wrapper(app, tmp_path):
+    path = _file(tmp_path)
+    environ = {"wsgi.file_wrapper": FileWrapper}
+    with app.test_request_context("/", environ_base=environ):
+        rv = send_preview(str(path))
+        assert isinstance(rv.response, FileWrapper)
+        body = b"".join(rv.response)
+    assert rv.status_code == 200 and body == DATA
+
+
+def test_replaced_file_is_revalidated(app, tmp_path):
+    path = _file(tmp_path)
+    with app.test_request_context("/"):
+        rv = send_preview(str(path))
+    etag = rv.headers["ETag"]
+    assert rv.cache_control.max_age == MAX_AGE <= 3600 and rv.cache_control.must_revalidate
+
+    with app.test_request_context("/", headers={"If-None-Match": etag}):
+        assert send_preview(str(path)).status_code == 304
+
+    # тот же URL, новый файл: старый ETag больше не совпадает
+    path.write_bytes(DATA[::-1])
+    st = path.stat()
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+    with app.test_request_context("/", headers={"If-None-Match": etag}):
+        rv = send_preview(str(path))
+        body = b"".join(rv.response)
+    assert rv.status_code == 200 and rv.headers["ETag"] != etag and body == DATA[::-1]
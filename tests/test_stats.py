@@ -0,0 +1,56 @@
+from models import Catalog, Track, User, UserDecadeStats
+import stats
+
+
+def _user(session, email="stats@example.com"):
+    user = User(email=email)
+    user.set_password("secret12")
+    session.add(user)
+    session.commit()
+    return user
+
+
+def _decades(session, user_id):
+    return dict(session.query(UserDecadeStats.decade, UserDecadeStats.tracks)
+                .filter_by(user_id=user_id).all())
+
+
+def test_removal_uses_decade_counted_on_add(session):
+    user = _user(session)
+    track = Track(title="Song", artist="Band", owner=user)
+    session.add(track)
+    stats.tracks_added(session, user.id, [track])
+    session.commit()
+    assert track.stats_decade == 0
+    assert _decades(session, user.id) == {0: 1}
+
+    # год в каталоге появился уже после того, как трек учли
+    session.add(Catalog(title="Song", artist="Band", year=2012))
+    session.commit()
+
+    stats.tracks_removed(session, user.id, [track])
+    session.delete(track)
+    session.commit()
+
+    assert stats.summary(session, user.id)["tracks"] == 0
+    assert _decades(session, user.id) == {}
+
+
+def test_rebuild_rebuckets_by_current_catalog_year(session):
+    user = _user(session)
+    track = Track(title="Song", artist="Band", owner=user)
+    session.add(track)
+    stats.tracks_added(session, user.id, [track])
+    session.commit()
+
+    session.add(Catalog(title="Song", artist="Band", year=2012))
+    session.commit()
+    stats.rebuild(session, [user.id])
+    session.refresh(track)
+    assert track.stats_decade == 2010
+    assert _decades(session, user.id) == {2010: 1}
+
+    stats.tracks_removed(session, user.id, [track])
+    session.delete(track)
+    session.commit()
+    assert _decades(session, user.id) == {}